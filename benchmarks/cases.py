@@ -0,0 +1,156 @@
+from __future__ import division
+import copy
+import subprocess
+import sys
+from collections import OrderedDict
+
+from benchmarks.fixtures import (
+    ROUTE_SIZES,
+    SWEEP_SIZES,
+    load_route_fixture,
+    make_speed_df,
+    replay
+)
+
+CASES = OrderedDict()
+LOCAL_EPSG = '2768'
+
+
+class ChildPeak(float):
+    # Returned by a case callable that does its work in a child process:
+    # the child's peak RSS in MB, reported instead of the memory the
+    # callable allocates in the benchmark process.
+    pass
+
+
+def maxrss_mb(maxrss):
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return maxrss / (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0)
+
+
+def register(name, params):
+    # Each setup returns a zero-argument callable; only that callable is
+    # timed and measured.
+    def wrapper(setup):
+        for param in params:
+            CASES['{0}[{1}]'.format(name, param)] = (setup, param)
+        return setup
+    return wrapper
+
+
+def _route_edges(fixture):
+    import validator.validator as val
+    shapeCoords = val.decode(fixture['shape'])
+    edges = copy.deepcopy(fixture['edges'])
+    return shapeCoords, edges
+
+
+def _matched_route(fixture, noise=20, sampleRate=5):
+    import validator.validator as val
+    shapeCoords, edges = _route_edges(fixture)
+    dfEdges = val.format_edge_df(edges)
+    with replay(fixture):
+        dfEdges, jsonDict, _, gpsMatchEdges = val.synthesize_gps(
+            dfEdges, shapeCoords, LOCAL_EPSG, noise=noise,
+            sampleRate=sampleRate, turnPenaltyFactor=500)
+        segments, _ = val.get_reporter_segments(jsonDict)
+    return dfEdges, gpsMatchEdges, segments
+
+
+@register('import', [
+    'validator.validator', 'validator.plotting', 'validator.maps'])
+def import_case(module):
+    # cold import in a fresh interpreter, i.e. what every sweep worker pays
+    cmd = [sys.executable, '-c', (
+        'import resource, {0}; '
+        'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)').format(
+            module)]
+    return lambda: ChildPeak(maxrss_mb(int(subprocess.check_output(cmd))))
+
+
+@register('decode', ROUTE_SIZES)
+def decode_case(size):
+    import validator.validator as val
+    shape = load_route_fixture(size)['shape']
+    return lambda: val.decode(shape)
+
+
+@register('get_coords_per_second', ROUTE_SIZES)
+def coords_per_second_case(size):
+    import validator.validator as val
+    shapeCoords, edges = _route_edges(load_route_fixture(size))
+    return lambda: val.get_coords_per_second(
+        shapeCoords, copy.deepcopy(edges), LOCAL_EPSG)
+
+
+@register('get_route_timeline', ROUTE_SIZES)
+def route_timeline_case(size):
+    import validator.validator as val
+    shapeCoords, edges = _route_edges(load_route_fixture(size))
+    return lambda: val.get_route_timeline(shapeCoords, edges, LOCAL_EPSG)
+
+
+@register('format_edge_df', ROUTE_SIZES)
+def format_edge_df_case(size):
+    import validator.validator as val
+    shapeCoords, edges = _route_edges(load_route_fixture(size))
+    return lambda: val.format_edge_df(edges)
+
+
+@register('synthesize_gps', [
+    '{0}-{1}s'.format(size, rate) for size in ROUTE_SIZES
+    for rate in [0.5, 1, 30]])
+def synthesize_gps_case(param):
+    import validator.validator as val
+    size, rate = param.split('-')
+    fixture = load_route_fixture(size)
+    shapeCoords, edges = _route_edges(fixture)
+    dfEdges = val.format_edge_df(edges)
+
+    def run():
+        with replay(fixture):
+            val.synthesize_gps(
+                dfEdges, shapeCoords, LOCAL_EPSG, noise=20,
+                sampleRate=float(rate[:-1]), turnPenaltyFactor=500)
+    return run
+
+
+@register('get_match_scores', ROUTE_SIZES)
+def match_scores_case(size):
+    import validator.validator as val
+    dfEdges, gpsMatchEdges, segments = _matched_route(
+        load_route_fixture(size))
+    return lambda: val.get_match_scores(segments, dfEdges, gpsMatchEdges)
+
+
+@register('get_speed_scores', ROUTE_SIZES)
+def speed_scores_case(size):
+    import validator.validator as val
+    dfEdges, gpsMatchEdges, segments = _matched_route(
+        load_route_fixture(size))
+    return lambda: val.get_speed_scores(gpsMatchEdges, dfEdges, segments, 5)
+
+
+@register('get_optimal_speed_error_threshold', sorted(SWEEP_SIZES))
+def speed_error_threshold_case(sweep):
+    import validator.plotting as plotting
+    from matplotlib import pyplot as plt
+    speedDf = make_speed_df(sweep)
+
+    def run():
+        plotting.get_optimal_speed_error_threshold(
+            speedDf, plot=False, saveFig=False)
+        plt.close('all')
+    return run
+
+
+@register('end_to_end_cell', ROUTE_SIZES)
+def end_to_end_cell_case(size):
+    import validator.validator as val
+    fixture = load_route_fixture(size)
+
+    def run():
+        with replay(fixture):
+            val.get_route_metrics(
+                [fixture['route']], [5], [20], saveResults=False)
+    return run
@@ -0,0 +1,261 @@
+from __future__ import division
+import copy
+import json
+import math
+import os
+import random
+from contextlib import contextmanager
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'fixtures')
+ROUTE_SIZES = ['1km', '5km', '50km']
+
+# (routes, noise levels, sample rates) per sweep; 'notebook' mirrors the
+# grid used in notebooks/validation.ipynb
+SWEEP_SIZES = {
+    'notebook': (10, 21, 5),
+    'multi_city': (100, 21, 5),
+    'large': (500, 21, 5)}
+
+
+def _encode(coords):
+    # [lon, lat] pairs -> polyline at 1e6 precision, as Valhalla returns
+    import numpy as np
+    import validator.validator as val
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return val.encode_polyline(coords[:, 0], coords[:, 1])
+
+
+def build_route_fixture(name, lengthKm, seed=0, stLat=37.7749,
+                        stLon=-122.4194):
+    # Deterministic street-grid walk in the same shape as a Valhalla
+    # /trace_attributes map_snap response, for use when no backend is
+    # available to record from.
+    rng = random.Random(seed)
+    coords = [[stLon, stLat]]
+    edges = []
+    heading = 0
+    edgeId = 10000000 + seed * 100000
+    segmentId = 800000000 + seed * 100000
+    segEdgesLeft = 0
+    traveled = 0
+    while traveled < lengthKm * 1e3:
+        if segEdgesLeft == 0:
+            segEdgesLeft = rng.randint(2, 5)
+            segmentId += 1
+            segEdges = segEdgesLeft
+            speed = rng.choice([24, 32, 40, 56, 72])
+            hasSegment = rng.random() > 0.1
+        if rng.random() < 0.3:
+            heading = (heading + rng.choice([1, 3])) % 4
+        blockLen = rng.uniform(80, 250)
+        numPts = rng.randint(1, 3)
+        beginIdx = len(coords) - 1
+        lon, lat = coords[-1]
+        for k in range(numPts):
+            step = blockLen / numPts
+            dLat = step / 111320.0
+            dLon = step / (111320.0 * math.cos(math.radians(lat)))
+            if heading == 0:
+                lat += dLat
+            elif heading == 1:
+                lon += dLon
+            elif heading == 2:
+                lat -= dLat
+            else:
+                lon -= dLon
+            coords.append([round(lon, 6), round(lat, 6)])
+        edge = {
+            "id": edgeId,
+            "begin_shape_index": beginIdx,
+            "end_shape_index": len(coords) - 1,
+            "length": round(blockLen / 1e3, 3),
+            "speed": speed,
+            "density": rng.randint(1, 15)}
+        if hasSegment:
+            position = segEdges - segEdgesLeft
+            edge["traffic_segments"] = [{
+                "segment_id": segmentId,
+                "starts_segment": position == 0,
+                "ends_segment": segEdgesLeft == 1,
+                "begin_percent": round(position / segEdges, 3),
+                "end_percent": round((position + 1) / segEdges, 3)}]
+        edges.append(edge)
+        edgeId += 1
+        segEdgesLeft -= 1
+        traveled += blockLen
+    return {
+        "name": name,
+        "length": round(traveled / 1e3, 3),
+        "route": [
+            {"{0}_start".format(name): {
+                "lat": coords[0][1], "lon": coords[0][0]}},
+            {"{0}_end".format(name): {
+                "lat": coords[-1][1], "lon": coords[-1][0]}}],
+        "shape": _encode(coords),
+        "edges": edges}
+
+
+def record_route_fixture(name, routeCoords, turnPenaltyFactor=500):
+    # Capture a fixture from a live Valhalla instance.
+    import validator.validator as val
+    shape, routeUrl = val.get_route_shape(routeCoords)
+    if shape is None:
+        raise ValueError(routeUrl)
+    edges, shapeCoords, _ = val.get_trace_attrs(
+        shape, shapeMatch="map_snap", turnPenaltyFactor=turnPenaltyFactor)
+    return {
+        "name": name,
+        "length": round(sum(edge['length'] for edge in edges), 3),
+        "route": routeCoords,
+        "shape": _encode(shapeCoords),
+        "edges": edges}
+
+
+def save_route_fixture(fixture):
+    path = os.path.join(FIXTURE_DIR, 'route_{0}.json'.format(fixture['name']))
+    with open(path, 'w') as fp:
+        json.dump(fixture, fp, separators=(',', ':'), sort_keys=True)
+    return path
+
+
+def load_route_fixture(size):
+    path = os.path.join(FIXTURE_DIR, 'route_{0}.json'.format(size))
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+
+def make_speed_df(sweep, segmentsPerRoute=12, seed=0):
+    import numpy as np
+    import pandas as pd
+    numRoutes, numNoise, numRates = SWEEP_SIZES[sweep]
+    rng = np.random.RandomState(seed)
+    noiseLevels = np.round(np.linspace(0, 100, numNoise), 3)
+    sampleRates = np.array([1, 5, 10, 20, 30][:numRates])
+    cells = numRoutes * numNoise * numRates
+    n = cells * segmentsPerRoute
+    noise = np.tile(np.repeat(noiseLevels, numRates), numRoutes)
+    rate = np.tile(sampleRates, numRoutes * numNoise)
+    noise = np.repeat(noise, segmentsPerRoute)
+    rate = np.repeat(rate, segmentsPerRoute)
+    pMatched = 0.95 - 0.5 * noise / 100
+    matched = rng.uniform(size=n) < pMatched
+    pctError = np.where(
+        matched, rng.normal(0.02, 0.15, size=n),
+        rng.lognormal(0, 0.8, size=n) - 0.5)
+    routeName = np.repeat(
+        ['route_{0}'.format(r) for r in range(numRoutes)],
+        numNoise * numRates * segmentsPerRoute)
+    segmentId = np.repeat(np.arange(numRoutes) * 1000, numNoise * numRates *
+                          segmentsPerRoute) + np.tile(
+        np.arange(segmentsPerRoute), cells)
+    return pd.DataFrame({
+        'route_name': routeName,
+        'segment_id': segmentId.astype(str),
+        'sample_rate': rate,
+        'noise': noise,
+        'pct_error': pctError,
+        'matched': matched})
+
+
+class ReplayResponse(object):
+
+    def __init__(self, url, body, statusCode=200):
+        self.url = url
+        self.status_code = statusCode
+        self.reason = 'OK' if statusCode == 200 else 'Replay error'
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class ReplayBackend(object):
+    # Stands in for the `requests` module inside validator.validator and
+    # answers /route, /trace_attributes and /report from a route fixture.
+
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.numShapePts = max(
+            edge['end_shape_index'] for edge in fixture['edges']) + 1
+        self.calls = 0
+        offsets = [0]
+        for edge in fixture['edges']:
+            offsets.append(offsets[-1] + edge['length'] / edge['speed'] * 3600)
+        self.edgeOffsets = offsets
+
+    def get(self, url, params=None):
+        self.calls += 1
+        body = json.loads(params['json']) if params else {}
+        if url.endswith('/route'):
+            return ReplayResponse(url, {"trip": {
+                "legs": [{"shape": self.fixture['shape']}],
+                "summary": {"length": self.fixture['length']}}})
+        elif '/trace_attributes' in url:
+            return ReplayResponse(url, self.trace_attributes(body))
+        elif url.endswith('/report'):
+            return ReplayResponse(url, self.report(body))
+        return ReplayResponse(url, {}, statusCode=404)
+
+    def _rescale(self, idx, numPts):
+        return int(round(idx * (numPts - 1) / (self.numShapePts - 1)))
+
+    def trace_attributes(self, body):
+        import validator.validator as val
+        if body.get('encoded_polyline') == self.fixture['shape']:
+            return {"edges": copy.deepcopy(self.fixture['edges']),
+                    "shape": self.fixture['shape']}
+        if 'shape' in body:
+            shape = body['shape']
+        else:
+            shape = [{"lat": lat, "lon": lon} for lon, lat in val.decode(
+                body['encoded_polyline'])]
+        edges = copy.deepcopy(self.fixture['edges'])
+        for edge in edges:
+            edge['begin_shape_index'] = self._rescale(
+                edge['begin_shape_index'], len(shape))
+            edge['end_shape_index'] = self._rescale(
+                edge['end_shape_index'], len(shape))
+        return {"edges": edges,
+                "shape": _encode([[pt['lon'], pt['lat']] for pt in shape])}
+
+    def report(self, body):
+        trace = body['trace']
+        t0 = trace[0]['time']
+        segments = []
+        current = None
+        for i, edge in enumerate(self.fixture['edges']):
+            segId = edge['traffic_segments'][0]['segment_id'] \
+                if 'traffic_segments' in edge else None
+            if current is None or current['segment_id'] != segId:
+                current = {
+                    "segment_id": segId,
+                    "begin_shape_index": self._rescale(
+                        edge['begin_shape_index'], len(trace)),
+                    "start_time": round(t0 + self.edgeOffsets[i], 1),
+                    "internal": False,
+                    "length": 0}
+                segments.append(current)
+            current['end_shape_index'] = self._rescale(
+                edge['end_shape_index'], len(trace))
+            current['end_time'] = round(t0 + self.edgeOffsets[i + 1], 1)
+            current['length'] += int(round(edge['length'] * 1e3))
+        return {"segment_matcher": {"segments": segments}}
+
+
+@contextmanager
+def replay(fixture):
+    import validator.validator as val
+    backend = ReplayBackend(fixture)
+    original = val.requests
+    val.requests = backend
+    try:
+        yield backend
+    finally:
+        val.requests = original
+
+
+if __name__ == '__main__':
+    for seed, size in enumerate(ROUTE_SIZES):
+        print(save_route_fixture(
+            build_route_fixture(size, float(size[:-2]), seed=seed)))
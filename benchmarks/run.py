@@ -0,0 +1,151 @@
+from __future__ import division
+import os
+os.environ.setdefault('MPLBACKEND', 'Agg')  # noqa: E402
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def _peak_rss_mb():
+    from benchmarks.cases import maxrss_mb
+    return maxrss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _peak_mb(func):
+    # Peak memory of one call. tracemalloc counts what func allocates from
+    # its own baseline (numpy reports its buffers to it, so arrays are
+    # included). Python 2 has no tracemalloc and falls back to RSS growth,
+    # which only shows on the first call, before the high-water mark is
+    # reached. Cases that run in a child process report its peak RSS.
+    from benchmarks.cases import ChildPeak
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            result = func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak = peak / 1024.0 ** 2
+    else:
+        rssBefore = _peak_rss_mb()
+        result = func()
+        peak = max(0, _peak_rss_mb() - rssBefore)
+    return result if isinstance(result, ChildPeak) else peak
+
+
+def _measure(name, repeat, queue):
+    # Runs in a fresh child process so one case's allocations don't leak
+    # into the next. Memory is measured on the first, untimed call; the
+    # timed calls follow it, untraced.
+    from benchmarks.cases import CASES
+    try:
+        setup, param = CASES[name]
+        func = setup(param)
+        peak = _peak_mb(func)
+        times = []
+        for _ in range(repeat):
+            sttm = timeit.default_timer()
+            func()
+            times.append(timeit.default_timer() - sttm)
+        times.sort()
+        queue.put({
+            'time': times[0],
+            'median_time': times[len(times) // 2],
+            'peak_mb': round(peak, 2)})
+    except Exception as e:
+        queue.put({'error': '{0}: {1}'.format(type(e).__name__, e)})
+
+
+def run_case(name, repeat=5):
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_measure, args=(name, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or 'error' in result:
+            continue
+        if result['time'] > base['time'] * (1 + tolerance):
+            regressions.append((name, 'time', base['time'], result['time']))
+        # small absolute slack so allocator noise on tiny cases is ignored
+        if result['peak_mb'] > base['peak_mb'] * (1 + tolerance) + 1:
+            regressions.append(
+                (name, 'peak_mb', base['peak_mb'], result['peak_mb']))
+    return regressions
+
+
+def main(argv=None):
+    from benchmarks.cases import CASES
+
+    parser = argparse.ArgumentParser(
+        description='Offline benchmarks for the validator hot paths.')
+    parser.add_argument('-k', '--filter', default='',
+                        help='only run cases whose name contains this string')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true',
+                        help='write results to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown before failing')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as fp:
+            baseline = json.load(fp)['results']
+
+    results = {}
+    print('{0:<50}{1:>12}{2:>12}{3:>12}'.format(
+        'case', 'time (ms)', 'peak (MB)', 'vs base'))
+    for name in CASES:
+        if args.filter not in name:
+            continue
+        result = run_case(name, repeat=args.repeat)
+        results[name] = result
+        if 'error' in result:
+            print('{0:<50}{1}'.format(name, result['error']))
+            continue
+        ratio = ''
+        if name in baseline:
+            ratio = '{0:.2f}x'.format(result['time'] / baseline[name]['time'])
+        print('{0:<50}{1:>12.2f}{2:>12.2f}{3:>12}'.format(
+            name, result['time'] * 1e3, result['peak_mb'], ratio))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as fp:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': baseline}, fp, indent=2, sort_keys=True)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, base, new in regressions:
+        print('REGRESSION {0} {1}: {2:.4g} -> {3:.4g}'.format(
+            name, metric, base, new))
+    errors = [name for name in results if 'error' in results[name]]
+    return 1 if regressions or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+from __future__ import division
+
+import numpy as np
+import pytest
+
+import validator.adaptive as adaptive
+import validator.validator as val
+
+NOISE_LEVELS = list(range(0, 110, 10))
+
+
+def test_interval_priority():
+    assert adaptive.get_interval_priority([0.5, 0.5], [0.52, 0.5]) is None
+    assert adaptive.get_interval_priority(
+        [1.0, np.nan], [0.5, 0.7]) == (False, pytest.approx(0.4))
+    assert adaptive.get_interval_priority([np.nan], [0.5]) is None
+    # a flat interval is still refined where it straddles the threshold,
+    # and that outranks any change away from it
+    nearThreshold = adaptive.get_interval_priority(
+        [0.81, 0.81], [0.79, 0.79], threshold=0.8)
+    assert nearThreshold == (True, pytest.approx(0.02))
+    assert nearThreshold > adaptive.get_interval_priority([0.2], [0.0])
+    # or where the threshold is inside one end's confidence interval
+    assert adaptive.get_interval_priority(
+        [0.7, 0.9], [0.95, 0.95], threshold=0.85)[0]
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    # route 'a' matches everything below 35 m noise and nothing above;
+    # route 'nothing' never matches a segment (-1); 'multi' is not scored
+    records = {
+        name: {
+            'name': name, 'edges': [], 'shape_coords': [],
+            'avg_density': 1.0, 'multi_segment': name == 'multi',
+            'cols': {'route_url': name, 'trace_attr_url': name}}
+        for name in ['a', 'nothing', 'multi']}
+    monkeypatch.setattr(
+        val, 'prepare_route',
+        lambda rteCoords, turnPenaltyFactor=500: records.get(rteCoords))
+    evaluated = []
+
+    def get_cell_metrics(routeName, edges, shapeCoords, noise, sampleRate,
+                         **kwargs):
+        evaluated.append((routeName, noise))
+        value = -1 if routeName == 'nothing' else float(noise < 35)
+        row = {'route': routeName, 'noise': noise, 'sample_rate': sampleRate}
+        row.update((metric, value) for metric in val.DISTANCE_METRICS)
+        return row, None, None
+
+    monkeypatch.setattr(val, 'get_cell_metrics', get_cell_metrics)
+    return evaluated
+
+
+def test_bisects_towards_the_change(sweep):
+    df, _ = adaptive.get_adaptive_route_metrics(
+        ['a', 'nothing', 'multi', 'missing'], [5], NOISE_LEVELS)
+    # coarse 0/50/100, then the 0-50 interval is bisected down to the step;
+    # the flat 50-100 interval and the -1 route never trigger a refinement
+    assert [noise for name, noise in sweep if name == 'a'] == [
+        0, 50, 100, 20, 30, 40]
+    assert sorted(df.loc[df['route'] == 'a', 'noise']) == [
+        0, 20, 30, 40, 50, 100]
+    multi = df[df['route'] == 'multi']
+    assert multi['noise'].tolist() == NOISE_LEVELS
+    assert (multi['sample_rate'] == 5).all()
+    assert multi['segments'].isnull().all()
+
+
+def test_stops_at_max_calls(sweep):
+    # 4 routes cost 8 calls to prepare; each cell costs 2 per scored route
+    adaptive.get_adaptive_route_metrics(
+        ['a', 'nothing', 'multi', 'missing'], [5], NOISE_LEVELS,
+        maxCalls=8 + 4 * 4)
+    assert [noise for name, noise in sweep if name == 'a'] == [0, 50, 100, 20]
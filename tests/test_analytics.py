@@ -0,0 +1,75 @@
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+import validator.validator as val
+from validator.analytics import SpeedErrorStore
+
+SAMPLE_RATES = [1, 5, 10, 30]
+NOISE_LEVELS = [0.0, 20.0, 40.0, 60.0]
+
+
+def speed_frames(numFrames=12, seed=0):
+    # one frame per synthetic (route, noise, sample rate) cell
+    rng = np.random.RandomState(seed)
+    frames = []
+    for i in range(numFrames):
+        numRows = rng.randint(1, 40)
+        frames.append(pd.DataFrame({
+            'route_name': 'route_{0}'.format(i % 3),
+            'segment_id': rng.randint(100, 120, numRows).astype(str),
+            'sample_rate': rng.choice(SAMPLE_RATES[:-1]),
+            'noise': rng.choice(NOISE_LEVELS[:-1]),
+            'pct_error': rng.normal(0, 0.5, numRows),
+            'matched': rng.rand(numRows) > 0.3}))
+    return frames
+
+
+def test_appends_between_queries_match_a_single_load():
+    frames = speed_frames()
+    store = SpeedErrorStore()
+    for i, frame in enumerate(frames):
+        store.append(frame)
+        if i % 3 == 0:
+            # query mid-sweep, forcing a merge of the pending cells
+            store.quantiles()
+    expected = SpeedErrorStore.from_frame(pd.concat(frames))
+
+    # a single load sorts every row at once; merging cell by cell must
+    # give the same rows in the same order
+    pd.testing.assert_frame_equal(store.to_frame(), expected.to_frame())
+
+
+def test_accuracy_matrix_matches_validator():
+    frames = speed_frames(seed=1)
+    store = SpeedErrorStore()
+    for frame in frames:
+        store.append(frame)
+        store.accuracy_matrix([0.2], SAMPLE_RATES, NOISE_LEVELS)
+    speedDf = pd.concat(frames, ignore_index=True)
+    thresholds = [0.1, 0.2, 0.3, 0.4]
+    np.testing.assert_allclose(
+        store.accuracy_matrix(thresholds, SAMPLE_RATES, NOISE_LEVELS),
+        val.get_accuracy_matrix(
+            speedDf, thresholds, SAMPLE_RATES, NOISE_LEVELS))
+    # the unused sample rate and noise level are empty cells
+    accMat = store.accuracy_matrix([0.2], SAMPLE_RATES, NOISE_LEVELS)
+    assert np.isnan(accMat[-1]).all() and np.isnan(accMat[:, -1]).all()
+
+
+def test_quantiles_and_cdf_follow_appends():
+    frames = speed_frames(seed=2)
+    store = SpeedErrorStore()
+    for n, frame in enumerate(frames, 1):
+        store.append(frame)
+        speedDf = pd.concat(frames[:n], ignore_index=True)
+        expected = speedDf.groupby(['sample_rate', 'noise'])['pct_error']
+        quantiles = store.quantiles(q=(0.5,))
+        np.testing.assert_allclose(
+            quantiles['q0.5'].values, expected.median().values)
+        np.testing.assert_array_equal(
+            quantiles['count'].values, expected.size().values)
+        errors = np.sort(speedDf['pct_error'].values)
+        np.testing.assert_allclose(
+            store.cdf(errors), np.arange(1, len(errors) + 1) / len(errors))
@@ -0,0 +1,182 @@
+from __future__ import division
+import json
+
+import pytest
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+import validator.validator as val
+from benchmarks.fixtures import ReplayBackend, load_route_fixture
+from validator.async_client import AsyncValidatorClient
+from validator.backend import BackendError, BackendHealth
+
+
+def run(coroutine, *args, **kwargs):
+    return IOLoop.current().run_sync(lambda: coroutine(*args, **kwargs))
+
+
+def test_aimd_backs_off_once_per_overload_and_recovers():
+    backend = BackendHealth('valhalla', initialLimit=8, maxLimit=16)
+
+    @gen.coroutine
+    def request(ok):
+        start = yield backend.acquire()
+        yield gen.sleep(0.001)
+        backend.release(start, ok=ok)
+
+    for _ in range(50):
+        run(request, True)
+    assert backend.limit > 8
+    grown = backend.limit
+
+    @gen.coroutine
+    def overload():
+        # five requests in flight together, all failing in the same
+        # round trip, only halve the limit once
+        starts = yield [backend.acquire() for _ in range(5)]
+        yield gen.sleep(0.05)
+        for start in starts:
+            backend.release(start, ok=False)
+
+    run(overload)
+    assert backend.limit == pytest.approx(grown / 2)
+    assert backend.stats()['errors'] == 5
+
+    for _ in range(200):
+        run(request, True)
+    assert backend.limit == 16
+
+
+def test_limit_stays_within_bounds():
+    backend = BackendHealth('reporter', initialLimit=2, minLimit=1,
+                            maxLimit=4)
+
+    @gen.coroutine
+    def fail():
+        start = yield backend.acquire()
+        backend._lastDecrease = 0
+        backend.release(start, ok=False)
+
+    for _ in range(10):
+        run(fail)
+    assert backend.limit == 1
+
+
+def test_acquire_waits_for_a_free_slot():
+    backend = BackendHealth('valhalla', initialLimit=1, maxLimit=1)
+    order = []
+
+    @gen.coroutine
+    def request(name):
+        start = yield backend.acquire()
+        order.append((name, backend.inFlight))
+        yield gen.moment
+        backend.release(start)
+
+    @gen.coroutine
+    def both():
+        yield [request('a'), request('b')]
+
+    run(both)
+    assert order == [('a', 1), ('b', 1)]
+
+
+class FakeResponse(object):
+
+    def __init__(self, url, status, body):
+        self.url = url
+        self.status_code = status
+        self.reason = 'Bad Request' if status == 400 else 'OK'
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+def replay_client(traceAttrsStatus=200, reportError=None):
+    fixture = load_route_fixture('1km')
+    replay = ReplayBackend(fixture)
+    client = AsyncValidatorClient()
+
+    @gen.coroutine
+    def get(url, params=None):
+        if reportError is not None and url.endswith('/report'):
+            raise reportError
+        response = replay.get(url, params)
+        if '/trace_attributes' in url and traceAttrsStatus != 200:
+            response = FakeResponse(
+                url, traceAttrsStatus, {"error": "no match"})
+        raise gen.Return(response)
+
+    client.get = get
+    route = {
+        'name': 'a_to_b', 'edges': fixture['edges'],
+        'shape_coords': val.decode(fixture['shape']), 'avg_density': 1,
+        'cols': {'route_url': 'route', 'trace_attr_url': 'attrs'}}
+    return client, route
+
+
+def test_unmatched_trace_is_scored_as_empty_row():
+    client, route = replay_client(traceAttrsStatus=400)
+    row, segSpeedDf = run(client.run_cell, route, 20, 5)
+    assert segSpeedDf is None
+    assert row['route'] == 'a_to_b'
+    assert 'segments' not in row
+    assert client.failedCells == []
+
+
+def test_matched_trace_is_scored():
+    client, route = replay_client()
+    row, segSpeedDf = run(client.run_cell, route, 0, 5)
+    assert row['segments'] >= 0
+    assert len(segSpeedDf) > 0
+
+
+def test_failed_cells_are_recorded_not_raised():
+    client, route = replay_client(
+        reportError=BackendError('http://reporter/report', 503, 'busy'))
+    assert run(client.run_cell, route, 20, 5) is None
+    client.get_cell_metrics = lambda *args, **kwargs: {}['missing']
+    assert run(client.run_cell, route, 20, 10) is None
+    assert [failed['retryable'] for failed in client.failedCells] == [
+        True, False]
+
+    # only the backend failure is retried
+    client, _ = replay_client()
+    client.failedCells = [
+        {'route': route, 'noise': 20, 'sample_rate': 5, 'kwargs': {},
+         'error': '503', 'retryable': True},
+        {'route': route, 'noise': 20, 'sample_rate': 10, 'kwargs': {},
+         'error': 'KeyError', 'retryable': False}]
+    rows, speedDfs = run(client.retry_failed)
+    assert [row['sample_rate'] for row in rows] == [5]
+    assert [failed['sample_rate'] for failed in client.failedCells] == [10]
+
+
+def test_multi_segment_route_gets_placeholder_rows():
+    client, route = replay_client()
+    route['multi_segment'] = True
+
+    @gen.coroutine
+    def prepare_route(rteCoords, turnPenaltyFactor=500):
+        raise gen.Return(route)
+
+    client.prepare_route = prepare_route
+    rows, speedDfs = run(client.get_route_cells, None, [5, 10], [0, 20, 40])
+    assert speedDfs == []
+    assert [(row['route'], row['noise'], row['sample_rate'])
+            for row in rows] == [
+        ('a_to_b', 0, 5), ('a_to_b', 20, 5), ('a_to_b', 40, 5)]
+    assert all(row['route_url'] == 'route' for row in rows)
+
+
+def test_sweep_runs_from_route_coordinates():
+    # route name and /route params come from the POI dicts, on 2 and 3
+    client, _ = replay_client()
+    routeCoords = load_route_fixture('1km')['route']
+    df, speedDf = run(
+        client.get_route_metrics, [routeCoords], [5], [0, 20])
+    stName, endName = val.get_route_name(routeCoords)
+    assert df['route'].tolist() == ['{0}_to_{1}'.format(stName, endName)] * 2
+    assert df['segments'].notnull().all()
+    assert len(speedDf) > 0
@@ -0,0 +1,175 @@
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+import validator.ingest as ingest
+from validator.backend import BackendError
+
+
+def points(uuid, times, lat0=37.0):
+    times = np.asarray(times, dtype=float)
+    return pd.DataFrame({
+        'uuid': uuid, 'lat': lat0 + np.arange(len(times)) * 1e-4,
+        'lon': -122.0, 'time': times, 'accuracy': np.nan})
+
+
+def chunked(df, chunkSize):
+    df = df.sort_values('time', kind='mergesort').reset_index(drop=True)
+    for start in range(0, len(df), chunkSize):
+        yield ingest._format_points(df.iloc[start:start + chunkSize])
+
+
+def summarize(windows):
+    return [(window['uuid'], len(window['trace']), 'error' in window)
+            for window in windows]
+
+
+def test_sparse_reporter_in_time_sorted_stream_stays_in_one_window():
+    # A reports every second, B every 30 s; most chunks contain no B fix
+    stream = pd.concat([
+        points('A', np.arange(600)), points('B', np.arange(0, 600, 30))])
+    windows = list(ingest.iter_trace_windows(
+        chunked(stream, 50), windowSeconds=900, maxGap=120, minPoints=10))
+    assert sorted(summarize(windows)) == [('A', 600, False), ('B', 20, False)]
+
+
+def uuid_sorted_chunks(consumed):
+    # B's fixes are earlier than A's, so the chunk clock never passes A
+    stream = pd.concat([
+        points('A', np.arange(1000, 1300)), points('B', np.arange(0, 300))])
+    for start in range(0, len(stream), 70):
+        consumed.append(start)
+        yield ingest._format_points(stream.iloc[start:start + 70])
+
+
+def test_uuid_sorted_archive_is_not_fragmented():
+    consumed = []
+    windows = list(ingest.iter_trace_windows(
+        uuid_sorted_chunks(consumed), windowSeconds=900, maxGap=120,
+        minPoints=10))
+    assert summarize(windows) == [('A', 300, False), ('B', 300, False)]
+
+
+def test_idle_chunks_close_finished_uuids():
+    consumed = []
+    windows = []
+    for window in ingest.iter_trace_windows(
+            uuid_sorted_chunks(consumed), windowSeconds=900, maxGap=120,
+            minPoints=10, idleChunks=1):
+        windows.append((window['uuid'], len(window['trace'])))
+        if window['uuid'] == 'A':
+            # closed by the first chunk holding only B, not at the end
+            assert consumed[-1] == 350
+    assert windows == [('A', 300), ('B', 300)]
+
+
+def test_gaps_and_window_length_split_traces():
+    times = np.concatenate((np.arange(100), np.arange(400, 1500)))
+    windows = list(ingest.iter_trace_windows(
+        chunked(points('A', times), 64), windowSeconds=600, maxGap=120))
+    assert summarize(windows) == [
+        ('A', 100, False), ('A', 600, False), ('A', 500, False)]
+    for window in windows:
+        assert np.all(np.diff(window['trace']['time']) <= 120)
+
+
+def test_short_windows_are_yielded_with_an_error():
+    stream = pd.concat([points('A', np.arange(50)), points('B', [0, 5, 10])])
+    windows = list(ingest.iter_trace_windows(
+        chunked(stream, 20), minPoints=10))
+    assert sorted(summarize(windows)) == [('A', 50, False), ('B', 3, True)]
+
+
+def test_gpx_tracks_are_named_and_timed(tmpdir):
+    path = str(tmpdir.join('drive.gpx'))
+    fixes = ''.join(
+        '<trkpt lat="{0}" lon="-122"><name>fix</name>'
+        '<time>2017-05-01T00:00:{1:02d}Z</time></trkpt>'.format(
+            37 + i * 1e-4, i) for i in range(30))
+    with open(path, 'w') as fp:
+        fp.write(
+            '<gpx xmlns="http://www.topografix.com/GPX/1/1">'
+            '<trk><name>trip9</name><trkseg>' + fixes + '</trkseg></trk>'
+            '<trk><trkseg>' + fixes + '</trkseg></trk></gpx>')
+    df = pd.concat(list(ingest.read_trace_points(path, chunkSize=25)))
+    assert df.groupby('uuid').size().to_dict() == {'trip9': 30, 'drive_1': 30}
+    assert df['time'].iloc[0] == 1493596800
+
+
+class StubClient(object):
+    # answers map_snap and scoring without a backend; every 5th window
+    # fails once with a BackendError
+
+    def __init__(self):
+        self.calls = 0
+
+    @gen.coroutine
+    def get_trace_attrs(self, shape, **kwargs):
+        yield gen.moment
+        raise gen.Return(([{
+            'id': 1, 'begin_shape_index': 0, 'end_shape_index': 1,
+            'length': 1, 'speed': 40, 'density': 1,
+            'traffic_segments': [{
+                'segment_id': 1, 'starts_segment': True,
+                'begin_percent': 0, 'end_percent': 1}]}], None, 'url'))
+
+    @gen.coroutine
+    def score_trace(self, row, dfEdges, jsonDict, sampleRate):
+        self.calls += 1
+        if self.calls % 5 == 0:
+            raise BackendError('http://reporter/report', 503, 'busy')
+        row['segments'] = 0.0
+        raise gen.Return((row, pd.DataFrame({
+            'segment_id': ['1'], 'pct_error': [0.1], 'matched': [True]})))
+
+
+def test_every_window_is_written(tmpdir):
+    stream = pd.concat([
+        points('A', np.arange(2000)), points('B', np.arange(0, 2000, 20)),
+        points('C', [0, 1, 2])])
+    path = str(tmpdir.join('probes.csv'))
+    stream.sort_values('time', kind='mergesort').to_csv(path, index=False)
+    truth = {
+        uuid: np.column_stack((
+            np.full(3000, -122.0), 37.0 + np.arange(3000) * 1e-4))
+        for uuid in ['A', 'B']}
+    scoresPath = str(tmpdir.join('scores.csv'))
+    speedPath = str(tmpdir.join('speeds.csv'))
+    numRows = IOLoop.current().run_sync(lambda: ingest.score_trace_files(
+        [path], truth, scoresPath, speedPath, client=StubClient(),
+        maxInFlight=2, retryDelay=0.001, chunkSize=100, windowSeconds=600))
+
+    scores = pd.read_csv(scoresPath)
+    assert numRows == len(scores) == 9
+    assert scores.groupby('uuid').size().to_dict() == {'A': 4, 'B': 4, 'C': 1}
+    assert scores.loc[scores['uuid'] != 'C', 'error'].isnull().all()
+    assert scores.loc[scores['uuid'] == 'C', 'error'].str.contains(
+        'minPoints').all()
+    assert len(pd.read_csv(speedPath)) == 8
+
+
+def test_irregular_and_unmatched_windows_are_scored_or_flagged():
+    # most fixes share a timestamp, so the median interval is 0
+    times = np.array([0, 0, 0, 0, 0, 0, 1, 2, 3, 120], dtype=float)
+    window = ingest._make_window('A', {
+        'lat': 37.0 + np.arange(10) * 1e-4, 'lon': np.full(10, -122.0),
+        'time': times, 'accuracy': np.full(10, np.nan)})
+    truth = np.column_stack((
+        np.full(20, -122.0), 37.0 + np.arange(20) * 1e-4))
+    client = StubClient()
+    row, segSpeedDf = IOLoop.current().run_sync(
+        lambda: ingest.score_window(client, window, truth))
+    assert row['sample_rate'] == 120 / 9
+    assert 'error' not in row and segSpeedDf is not None
+
+    @gen.coroutine
+    def unmatched(shape, **kwargs):
+        raise gen.Return((None, None, 'Bad Request'))
+
+    client.get_trace_attrs = unmatched
+    row, segSpeedDf = IOLoop.current().run_sync(
+        lambda: ingest.score_window(client, window, truth))
+    assert 'Bad Request' in row['error'] and segSpeedDf is None
@@ -0,0 +1,75 @@
+from __future__ import division
+
+import pandas as pd
+
+import validator.planner as planner
+import validator.validator as val
+
+
+def route_record(name, numShapePts, duration, multiSegment=False):
+    return {
+        'name': name, 'edges': [], 'shape_coords': [], 'avg_density': 1.0,
+        'multi_segment': multiSegment, 'duration': duration,
+        'num_shape_pts': numShapePts,
+        'cols': {'route_url': name + '_url', 'trace_attr_url': 'attrs'}}
+
+
+def test_plan_sweep_puts_expensive_cells_first():
+    routes = [route_record('short', 10, 60), route_record('long', 100, 600)]
+    cells = planner.plan_sweep(routes, [1, 10], [0, 20])
+    costs = [cell['cost'] for cell in cells]
+    assert costs == sorted(costs, reverse=True)
+    assert cells[0]['route'] == 1 and cells[0]['sample_rate'] == 1
+    assert cells[0]['cost'] == 100 + 600
+    # equal costs keep the sweep order
+    assert [cell['order'] for cell in cells[:2]] == [(1, 0, 0), (1, 1, 0)]
+
+
+def test_assign_cells_balances_load():
+    cells = [{'cost': cost} for cost in [7, 5, 4, 3, 3, 2]]
+    assignments = planner.assign_cells(cells, 2)
+    assert [[cell['cost'] for cell in worker] for worker in assignments] == [
+        [7, 3, 2], [5, 4, 3]]
+
+
+def test_stratify_routes_samples_each_band():
+    routeList = list(range(10))
+    lengths = [0.5, 1.5, 1.6, 1.7, 2.5, 2.6, 3.5, None, 4.5, 9]
+    sampled = planner.stratify_routes(
+        routeList, [1, 2, 3, 4], perBand=2, lengths=lengths, seed=0)
+    assert sorted(sampled[:2]) == sampled[:2]
+    assert set(sampled[:2]) <= {1, 2, 3}
+    assert sampled[2:] == [4, 5, 6]
+
+
+def test_planned_rows_follow_sweep_order(monkeypatch):
+    # cells finish in cost order in the pool; rows come back in
+    # route/noise/rate order, with multi-segment placeholders in place
+    records = {
+        'a': route_record('a', 10, 60),
+        'b': route_record('b', 10, 60, multiSegment=True),
+        'c': route_record('c', 100, 900)}
+    monkeypatch.setattr(
+        val, 'prepare_route',
+        lambda rteCoords, turnPenaltyFactor=500: records.get(rteCoords))
+
+    def get_cell_metrics(routeName, edges, shapeCoords, noise, sampleRate,
+                         **kwargs):
+        row = {'route': routeName, 'noise': noise, 'sample_rate': sampleRate,
+               'segments': 1.0}
+        segSpeedDf = pd.DataFrame({
+            'route_name': [routeName], 'segment_id': ['1'],
+            'sample_rate': [sampleRate], 'noise': [noise],
+            'pct_error': [0.0], 'matched': [True]})
+        return row, segSpeedDf, None
+
+    monkeypatch.setattr(val, 'get_cell_metrics', get_cell_metrics)
+    df, speedDf = planner.get_planned_route_metrics(
+        ['a', 'missing', 'b', 'c'], [5, 1], [0, 20], processes=2)
+    assert list(zip(df['route'], df['noise'], df['sample_rate'])) == [
+        ('a', 0, 5), ('a', 0, 1), ('a', 20, 5), ('a', 20, 1),
+        ('b', 0, 5), ('b', 20, 5),
+        ('c', 0, 5), ('c', 0, 1), ('c', 20, 5), ('c', 20, 1)]
+    assert df.loc[df['route'] == 'b', 'segments'].isnull().all()
+    assert df['route_url'].tolist()[4:6] == ['b_url', 'b_url']
+    assert speedDf['route_name'].tolist() == ['a'] * 4 + ['c'] * 4
@@ -0,0 +1,57 @@
+from __future__ import division
+import os
+
+import numpy as np
+import pandas as pd
+
+import validator.reporting as reporting
+import validator.validator as val
+from benchmarks.fixtures import SWEEP_SIZES, make_speed_df
+
+SAMPLE_RATES = [1, 5, 10, 20, 30]
+
+
+def city_results(seed=0):
+    speedDf = make_speed_df('notebook', seed=seed)
+    noiseLevels = sorted(speedDf['noise'].unique())
+    rng = np.random.RandomState(seed)
+    cells = speedDf[['route_name', 'noise', 'sample_rate']].drop_duplicates()
+    matchDf = pd.DataFrame({
+        'route': cells['route_name'].values,
+        'noise': cells['noise'].values,
+        'sample_rate': cells['sample_rate'].values})
+    for metric in val.DISTANCE_METRICS:
+        matchDf[metric] = rng.uniform(0, 1, len(matchDf))
+    return matchDf, speedDf, noiseLevels
+
+
+def test_city_report_data():
+    matchDf, speedDf, noiseLevels = city_results()
+    data = reporting.get_city_report_data(
+        matchDf, speedDf, SAMPLE_RATES, noiseLevels)
+
+    cdfs = data['speed_error_cdfs']
+    assert np.isclose(cdfs['match_cdf'][-1], 1)
+    # matched errors sit near 0 and missed ones far above, so the best
+    # threshold separates them
+    assert 0 < cdfs['threshold'] < 1
+    assert cdfs['true_positive_rate'] > cdfs['false_positive_rate']
+    assert len(data['thresholds_by_rate']) == len(SAMPLE_RATES)
+
+    shape = (len(SAMPLE_RATES), SWEEP_SIZES['notebook'][1])
+    assert data['accuracy'].shape == data['accuracy_by_rate'].shape == shape
+    assert ((data['accuracy'] >= 0) & (data['accuracy'] <= 1)).all()
+    assert len(data['distance_metrics']) == len(matchDf.groupby(
+        ['sample_rate', 'noise']))
+
+
+def test_build_report_writes_figures_and_summary(tmpdir):
+    matchDf, speedDf, noiseLevels = city_results()
+    outDir = str(tmpdir)
+    path = reporting.build_report(
+        {'San Francisco': (matchDf, speedDf)}, SAMPLE_RATES, noiseLevels,
+        outDir=outDir, processes=1)
+    figures = os.listdir(os.path.join(outDir, 'san_francisco'))
+    assert len(figures) == 4 + len(SAMPLE_RATES)
+    with open(path) as fp:
+        assert 'San Francisco' in fp.read()
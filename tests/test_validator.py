@@ -0,0 +1,99 @@
+from __future__ import division
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import validator.validator as val
+
+
+def speed_inputs():
+    # two edges at 40 km/h on one segment, driven at 18 km/h
+    gpsMatchEdges = [
+        {'id': 1, 'begin_shape_index': 0, 'end_shape_index': 8,
+         'length': 0.2, 'speed': 40,
+         'traffic_segments': [{'segment_id': 7}]},
+        {'id': 2, 'begin_shape_index': 8, 'end_shape_index': 20,
+         'length': 0.3, 'speed': 40,
+         'traffic_segments': [{'segment_id': 7}]}]
+    dfEdges = pd.DataFrame({
+        'id': [1, 2], 'length': [0.2, 0.3], 'speed': [40, 40],
+        'segment_id': ['7', '7']})
+    segments = [{
+        'segment_id': 7, 'start_time': 0, 'end_time': 100, 'length': 500}]
+    return gpsMatchEdges, dfEdges, segments
+
+
+def test_edge_speeds_are_timed_from_the_trace():
+    # a 15 s dropout after fix 8 makes the second edge take 70 s, not 60 s
+    gpsMatchEdges, dfEdges, segments = speed_inputs()
+    times = np.concatenate((np.arange(0, 45, 5), 55 + np.arange(12) * 5))
+    scores = val.get_speed_scores(
+        gpsMatchEdges, dfEdges, segments, 5, times)
+    speeds = [0.2 / (40 / 3600), 0.3 / (70 / 3600)]
+    assert scores[0] == pytest.approx(np.median(
+        [(speed - 40) / 40 for speed in speeds]))
+    assert val.get_speed_scores(
+        gpsMatchEdges, dfEdges, segments, 5)[0] == pytest.approx(-0.55)
+
+
+def test_shape_longer_than_trace_falls_back_to_sample_rate():
+    # the matched shape has 21 points but the trace only 10 fixes
+    gpsMatchEdges, dfEdges, segments = speed_inputs()
+    scores = val.get_speed_scores(
+        gpsMatchEdges, dfEdges, segments, 5, np.arange(0, 50, 5))
+    assert scores[0] == pytest.approx(-0.55)
+    assert scores[0] == pytest.approx(val.get_speed_scores(
+        gpsMatchEdges, dfEdges, segments, 5)[0])
+
+
+def test_route_name_and_params_from_poi_dicts():
+    routeCoords = [
+        {u'Caf\xe9 Flore': {'lat': 37.1, 'lon': -122.1}},
+        {'Ferry Building': {'lat': 37.2, 'lon': -122.2}}]
+    assert val.get_route_name(routeCoords) == ('Caf Flore', 'Ferry Building')
+    locations = json.loads(val.get_route_params(routeCoords)['json'])[
+        'locations']
+    assert [(loc['lat'], loc['lon']) for loc in locations] == [
+        (37.1, -122.1), (37.2, -122.2)]
+
+
+def test_encode_polyline_round_trips_through_decode():
+    rng = np.random.RandomState(0)
+    # large jumps need all seven 5-bit chunks; negative and zero deltas too
+    lon = np.concatenate(([-122.419416, -122.419416, 179.999999, -180.0],
+                          -122.4 + np.cumsum(rng.normal(0, 1e-3, 200))))
+    lat = np.concatenate(([37.774929, 37.774929, -89.999999, 90.0],
+                          37.7 + np.cumsum(rng.normal(0, 1e-3, 200))))
+    lon, lat = np.round(lon, 6), np.round(lat, 6)
+    decoded = np.array(val.decode(val.encode_polyline(lon, lat)))
+    np.testing.assert_array_equal(decoded[:, 0], lon)
+    np.testing.assert_array_equal(decoded[:, 1], lat)
+    assert val.encode_polyline(np.array([]), np.array([])) == ''
+
+
+def test_report_payload_is_valid_json():
+    trace = np.zeros(3, dtype=val.TRACE_DTYPE)
+    trace['lat'] = [37.1, 37.2, 37.3]
+    trace['lon'] = [-122.1, -122.2, -122.3]
+    trace['time'] = [1000, 1005.5, 1011]
+    gpsTrace = {
+        'uuid': 'abc', 'trace': trace, 'shape_match': 'map_snap',
+        'match_options': {'mode': 'auto', 'gps_accuracy': 5.0}}
+    payload = json.loads(val.dumps_report_payload(gpsTrace))
+    assert [(pt['lat'], pt['lon'], pt['time'])
+            for pt in payload.pop('trace')] == [
+        (37.1, -122.1, 1000), (37.2, -122.2, 1005.5), (37.3, -122.3, 1011)]
+    assert payload == {k: v for k, v in gpsTrace.items() if k != 'trace'}
+
+    # whole-second times are written as integers; list traces as is
+    trace['time'] = [1000, 1005, 1010]
+    assert '"time":1005}' in val.dumps_report_payload({'trace': trace})
+    assert json.loads(val.dumps_report_payload({'trace': trace})) == {
+        'trace': [{'lat': 37.1, 'lon': -122.1, 'time': 1000},
+                  {'lat': 37.2, 'lon': -122.2, 'time': 1005},
+                  {'lat': 37.3, 'lon': -122.3, 'time': 1010}]}
+    listTrace = {'trace': [{'lat': 1.0, 'lon': 2.0, 'time': 3}]}
+    assert json.loads(val.dumps_report_payload(listTrace)) == listTrace
@@ -0,0 +1,137 @@
+from __future__ import division
+import numpy as np
+import pandas as pd
+
+import validator.validator as val
+
+
+def get_coarse_indices(numLevels, coarseSize):
+    return sorted(set(np.round(np.linspace(
+        0, numLevels - 1, min(coarseSize, numLevels))).astype(int)))
+
+
+def get_interval_priority(a, b, threshold=None, minChange=0.05):
+    # a and b are the per-route metric values at two evaluated grid points.
+    # Returns None if the interval between them is not worth refining.
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    a = a[~np.isnan(a)]
+    b = b[~np.isnan(b)]
+    if len(a) == 0 or len(b) == 0:
+        return None
+    meanA, meanB = a.mean(), b.mean()
+    change = abs(meanA - meanB)
+    nearThreshold = False
+    if threshold is not None:
+        halfWidths = [
+            1.96 * vals.std(ddof=1) / np.sqrt(len(vals)) if len(vals) > 1
+            else 0 for vals in (a, b)]
+        nearThreshold = (
+            (meanA - threshold) * (meanB - threshold) < 0 or
+            abs(meanA - threshold) <= halfWidths[0] or
+            abs(meanB - threshold) <= halfWidths[1])
+    if not nearThreshold and change <= minChange:
+        return None
+    return (nearThreshold, change)
+
+
+def get_adaptive_route_metrics(routeList, sampleRates, noiseLevels,
+                               maxCalls=2000, metric='distance traveled',
+                               threshold=None, minChange=0.05,
+                               coarseSize=(3, 3), turnPenaltyFactor=500,
+                               localEpsg='2768', speedStore=None,
+                               **synthKwargs):
+    # Sweeps the same noiseLevels x sampleRates grid as get_route_metrics,
+    # but starts from a coarse subgrid and only bisects the intervals where
+    # the route-averaged `metric` changes by more than minChange or where
+    # its 95% confidence interval overlaps `threshold`, until maxCalls
+    # backend requests have been spent. Returns the same (df, speedDf).
+    noiseLevels = sorted(round(noise, 3) for noise in noiseLevels)
+    sampleRates = sorted(sampleRates)
+    calls = 0
+    routes = []
+    rows = []
+    speedDfs = []
+    for rteCoords in routeList:
+        # route + map_snap; a route that fails after /route is still
+        # counted as two calls
+        if calls + 2 > maxCalls:
+            break
+        route = val.prepare_route(rteCoords, turnPenaltyFactor)
+        calls += 2
+        if route is None:
+            continue
+        if route['multi_segment']:
+            rows += val.get_multi_segment_rows(
+                route, sampleRates, noiseLevels)
+            continue
+        routes.append(route)
+
+    values = {}
+    callsPerCell = 2 * len(routes)
+
+    def evaluate(rateIdx, noiseIdx):
+        noise = noiseLevels[noiseIdx]
+        sampleRate = sampleRates[rateIdx]
+        print(
+            "Noise Level: {0} // Sample Rate: {1} // "
+            "Backend calls: {2}/{3}".format(
+                noise, sampleRate, calls, maxCalls))
+        cellValues = []
+        for route in routes:
+            row, segSpeedDf, _ = val.get_cell_metrics(
+                route['name'], route['edges'], route['shape_coords'], noise,
+                sampleRate, turnPenaltyFactor=turnPenaltyFactor,
+                localEpsg=localEpsg, speedStore=speedStore, **synthKwargs)
+            row.update(route['cols'])
+            if segSpeedDf is not None:
+                row['avg_density'] = route['avg_density']
+                speedDfs.append(segSpeedDf)
+            rows.append(row)
+            # -1 flags a trace the reporter matched nothing on (see
+            # get_no_segment_scores), not a distance metric value
+            value = row.get(metric)
+            if value is None or (
+                    metric in val.DISTANCE_METRICS and value < 0):
+                value = np.nan
+            cellValues.append(value)
+        values[(rateIdx, noiseIdx)] = cellValues
+
+    pending = [
+        (r, n) for r in get_coarse_indices(len(sampleRates), coarseSize[1])
+        for n in get_coarse_indices(len(noiseLevels), coarseSize[0])]
+    while routes and calls + callsPerCell <= maxCalls:
+        if not pending:
+            candidates = []
+            for axis in (0, 1):
+                lines = {}
+                for key in values:
+                    lines.setdefault(key[1 - axis], []).append(key[axis])
+                for fixed, idxs in lines.items():
+                    idxs = sorted(idxs)
+                    for lo, hi in zip(idxs[:-1], idxs[1:]):
+                        if hi - lo < 2:
+                            continue
+                        loKey = (lo, fixed) if axis == 0 else (fixed, lo)
+                        hiKey = (hi, fixed) if axis == 0 else (fixed, hi)
+                        priority = get_interval_priority(
+                            values[loKey], values[hiKey], threshold,
+                            minChange)
+                        if priority is None:
+                            continue
+                        mid = (lo + hi) // 2
+                        midKey = (mid, fixed) if axis == 0 else (fixed, mid)
+                        if midKey not in values:
+                            candidates.append(
+                                (priority, hi - lo, midKey))
+            if not candidates:
+                break
+            pending = [max(candidates)[2]]
+        key = pending.pop(0)
+        if key in values:
+            continue
+        evaluate(*key)
+        calls += callsPerCell
+
+    df = pd.DataFrame(rows, columns=val.ROUTE_METRIC_COLUMNS)
+    return val.format_route_metrics(df), val.concat_speed_dfs(speedDfs)
@@ -0,0 +1,232 @@
+from __future__ import division
+import numpy as np
+import pandas as pd
+
+
+class SpeedErrorStore(object):
+    # Columnar store of the speedDf observations produced by
+    # get_route_metrics. Route names and segment ids are int-coded against
+    # category lists, rows are kept sorted by (sample_rate, noise, segment)
+    # so every (sample_rate, noise) cell is a contiguous slice.
+
+    columns = [
+        'route_name', 'segment_id', 'sample_rate', 'noise', 'pct_error',
+        'matched']
+
+    def __init__(self):
+        self.routeNames = []
+        self.segmentIds = []
+        self._routeCodes = {}
+        self._segmentCodes = {}
+        self._pending = []
+        self._cache = {}
+        self._data = {
+            'route_code': np.empty(0, dtype=np.int32),
+            'segment_code': np.empty(0, dtype=np.int32),
+            'sample_rate': np.empty(0, dtype=np.float64),
+            'noise': np.empty(0, dtype=np.float64),
+            'pct_error': np.empty(0, dtype=np.float64),
+            'matched': np.empty(0, dtype=bool)}
+
+    @classmethod
+    def from_frame(cls, speedDf):
+        store = cls()
+        store.append(speedDf)
+        return store
+
+    def __len__(self):
+        return len(self._data['pct_error']) + sum(
+            len(chunk['pct_error']) for chunk in self._pending)
+
+    def _encode(self, values, categories, lookup):
+        codes, uniques = pd.factorize(pd.Series(values).astype(str))
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            if value not in lookup:
+                lookup[value] = len(categories)
+                categories.append(value)
+            mapping[i] = lookup[value]
+        return mapping[codes]
+
+    def append(self, speedDf, routeName=None, sampleRate=None, noise=None):
+        # routeName/sampleRate/noise fill columns a per-cell segSpeedDf
+        # does not carry yet
+        numRows = len(speedDf)
+        if numRows == 0:
+            return self
+        routes = speedDf['route_name'] if routeName is None else \
+            [routeName] * numRows
+        rates = speedDf['sample_rate'] if sampleRate is None else \
+            np.repeat(sampleRate, numRows)
+        noises = speedDf['noise'] if noise is None else \
+            np.repeat(noise, numRows)
+        self._pending.append({
+            'route_code': self._encode(
+                routes, self.routeNames, self._routeCodes),
+            'segment_code': self._encode(
+                speedDf['segment_id'], self.segmentIds, self._segmentCodes),
+            'sample_rate': np.asarray(rates, dtype=np.float64),
+            'noise': np.asarray(noises, dtype=np.float64),
+            'pct_error': np.asarray(speedDf['pct_error'], dtype=np.float64),
+            'matched': np.asarray(speedDf['matched'], dtype=bool)})
+        return self
+
+    def _consolidate(self):
+        # sorts only the pending rows and merges them into the sorted data,
+        # so appending a cell does not re-sort everything stored before it
+        if not self._pending:
+            return self._data
+        batch = {
+            key: np.concatenate([chunk[key] for chunk in self._pending])
+            for key in self._data}
+        order = np.lexsort(
+            (batch['segment_code'], batch['noise'], batch['sample_rate']))
+        batch = {key: values[order] for key, values in batch.items()}
+        data = self._data
+        positions = np.empty(len(order), dtype=np.intp)
+        starts, stops = _group_bounds(
+            [batch['sample_rate'], batch['noise']], len(order))
+        for start, stop in zip(starts, stops):
+            # new rows go after stored rows with the same key
+            lo, hi = _cell_range(
+                data, batch['sample_rate'][start], batch['noise'][start])
+            positions[start:stop] = lo + np.searchsorted(
+                data['segment_code'][lo:hi],
+                batch['segment_code'][start:stop], 'right')
+        self._data = {
+            key: np.insert(data[key], positions, batch[key]) for key in data}
+        self._pending = []
+        self._cache = {}
+        return self._data
+
+    def _bounds(self, by):
+        # start/stop offsets of each contiguous group for a sort-key prefix
+        key = ('bounds', by)
+        if key not in self._cache:
+            data = self._consolidate()
+            self._cache[key] = _group_bounds(
+                [data[col] for col in by], len(data['pct_error']))
+        return self._cache[key]
+
+    def _slice(self, sampleRate=None, noise=None):
+        data = self._consolidate()
+        if sampleRate is not None:
+            return slice(*_cell_range(data, sampleRate, noise)), None
+        rows = slice(0, len(data['pct_error']))
+        if noise is not None:
+            return rows, data['noise'] == noise
+        return rows, None
+
+    def select(self, sampleRate=None, noise=None, matched=None):
+        data = self._consolidate()
+        rows, mask = self._slice(sampleRate, noise)
+        selected = {key: values[rows] for key, values in data.items()}
+        if mask is not None:
+            selected = {key: values[mask] for key, values in selected.items()}
+        if matched is not None:
+            keep = selected['matched'] == bool(matched)
+            selected = {key: values[keep] for key, values in selected.items()}
+        return selected
+
+    def to_frame(self):
+        data = self._consolidate()
+        return pd.DataFrame({
+            'route_name': pd.Categorical.from_codes(
+                data['route_code'], self.routeNames),
+            'segment_id': pd.Categorical.from_codes(
+                data['segment_code'], self.segmentIds),
+            'sample_rate': data['sample_rate'],
+            'noise': data['noise'],
+            'pct_error': data['pct_error'],
+            'matched': data['matched']}, columns=self.columns)
+
+    def quantiles(self, q=(0.25, 0.5, 0.75), by=('sample_rate', 'noise'),
+                  matched=None):
+        by = tuple(by)
+        if by not in [('sample_rate',), ('sample_rate', 'noise')]:
+            raise ValueError(
+                "quantiles can only be grouped by ('sample_rate',) or "
+                "('sample_rate', 'noise')")
+        data = self._consolidate()
+        starts, stops = self._bounds(by)
+        rows = []
+        for start, stop in zip(starts, stops):
+            errors = data['pct_error'][start:stop]
+            if matched is not None:
+                errors = errors[data['matched'][start:stop] == bool(matched)]
+            row = [data[col][start] for col in by] + [len(errors)]
+            if len(errors):
+                row += list(np.percentile(errors, np.asarray(q) * 100))
+            else:
+                row += [np.nan] * len(q)
+            rows.append(row)
+        return pd.DataFrame(rows, columns=list(by) + ['count'] + [
+            'q{0}'.format(quantile) for quantile in q])
+
+    def cdf(self, values, sampleRate=None, noise=None, matched=None):
+        key = ('sorted', sampleRate, noise, matched)
+        if key not in self._cache:
+            self._consolidate()
+            self._cache[key] = np.sort(self.select(
+                sampleRate, noise, matched)['pct_error'])
+        errors = self._cache[key]
+        if len(errors) == 0:
+            return np.full(np.shape(values), np.nan)
+        return np.searchsorted(errors, values, side='right') / len(errors)
+
+    def accuracy_matrix(self, thresholds, sampleRates, noiseLevels):
+        # same result as validator.get_accuracy_matrix, one slice per cell
+        data = self._consolidate()
+        accMat = np.ones((len(sampleRates), len(noiseLevels)))
+        for i, sampleRate in enumerate(sampleRates):
+            if len(thresholds) == len(sampleRates):
+                threshold = thresholds[i]
+            else:
+                threshold = thresholds[0]
+            for j, noiseLevel in enumerate(noiseLevels):
+                rows, _ = self._slice(sampleRate, noiseLevel)
+                errors = data['pct_error'][rows]
+                matched = data['matched'][rows]
+                if len(errors) == 0:
+                    accMat[i, j] = np.nan
+                    continue
+                numTruePos = np.sum(matched & (errors <= threshold))
+                numTrueNeg = np.sum(~matched & (errors > threshold))
+                accMat[i, j] = (numTruePos + numTrueNeg) / len(errors)
+        return accMat
+
+    def segment_ranking(self, sampleRate=None, noise=None, matched=None,
+                        top=None):
+        selected = self.select(sampleRate, noise, matched)
+        errors = pd.Series(selected['pct_error'])
+        stats = errors.groupby(selected['segment_code']).agg(
+            ['count', 'median', 'mean'])
+        stats['abs_median'] = stats['median'].abs()
+        stats = stats.sort_values('abs_median', ascending=False)
+        stats.insert(0, 'segment_id', [
+            self.segmentIds[code] for code in stats.index])
+        stats = stats.reset_index(drop=True)
+        return stats if top is None else stats.head(top)
+
+
+def _group_bounds(cols, numRows):
+    # start/stop offsets of the runs of equal values across sorted columns
+    change = np.zeros(max(numRows - 1, 0), dtype=bool)
+    for values in cols:
+        change |= values[1:] != values[:-1]
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1)) \
+        if numRows else np.empty(0, dtype=int)
+    stops = np.append(starts[1:], numRows).astype(int)
+    return starts, stops
+
+
+def _cell_range(data, sampleRate, noise=None):
+    # rows of one sample rate (and noise) in data sorted by sample_rate,
+    # noise, segment; an empty range sits where such rows would go
+    start = np.searchsorted(data['sample_rate'], sampleRate, 'left')
+    stop = np.searchsorted(data['sample_rate'], sampleRate, 'right')
+    if noise is not None:
+        noises = data['noise'][start:stop]
+        stop = start + np.searchsorted(noises, noise, 'right')
+        start = start + np.searchsorted(noises, noise, 'left')
+    return int(start), int(stop)
@@ -0,0 +1,400 @@
+from __future__ import division
+import itertools
+import json
+import time as t
+from random import shuffle
+
+import pandas as pd
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.httputil import url_concat
+from tornado.locks import Condition
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+import validator.validator as val
+from validator.backend import BackendError, BackendHealth, is_overload
+
+
+class AsyncResponse(object):
+    # requests.Response look-alike so the parse_* helpers in
+    # validator.validator serve both the blocking and the async client
+
+    def __init__(self, response):
+        self.status_code = response.code
+        self.reason = response.reason
+        self.url = response.effective_url
+        self.body = response.body
+
+    def json(self):
+        body = self.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        return json.loads(body)
+
+
+class AsyncValidatorClient(object):
+    # Coroutine counterparts of the validator's backend calls on one shared
+    # tornado AsyncHTTPClient. Tornado is the event loop the notebook kernel
+    # already runs (and sits on asyncio under Python 3), so calls can be
+    # started from a cell and left in flight without threads.
+    # Each host gets an AIMD concurrency limit between 1 and maxPerHost
+    # (see validator.backend). Cells that fail on an overloaded backend are
+    # kept in failedCells / failedRoutes and retried by get_route_metrics.
+
+    def __init__(self, maxPerHost=8, maxClients=256, requestTimeout=120,
+                 initialPerHost=4, targetLatency=None):
+        self.http = AsyncHTTPClient(
+            force_instance=True, max_clients=maxClients)
+        self.maxPerHost = maxPerHost
+        self.initialPerHost = min(initialPerHost, maxPerHost)
+        self.targetLatency = targetLatency
+        self.requestTimeout = requestTimeout
+        self.backends = {}
+        self.failedCells = []
+        self.failedRoutes = []
+        self._activeCells = 0
+        self._cellsChanged = Condition()
+
+    def close(self):
+        self.http.close()
+
+    def backend(self, url):
+        host = urlparse(url).netloc
+        if host not in self.backends:
+            self.backends[host] = BackendHealth(
+                host, initialLimit=self.initialPerHost,
+                maxLimit=self.maxPerHost, targetLatency=self.targetLatency)
+        return self.backends[host]
+
+    def backend_stats(self):
+        return pd.DataFrame(
+            [backend.stats() for backend in self.backends.values()])
+
+    @gen.coroutine
+    def get(self, url, params=None):
+        if params:
+            url = url_concat(url, params)
+        backend = self.backend(url)
+        start = yield backend.acquire()
+        try:
+            response = yield self.http.fetch(
+                url, request_timeout=self.requestTimeout, raise_error=False)
+        except (HTTPError, IOError, OSError) as e:
+            # timeouts and refused connections
+            backend.release(start, ok=False)
+            raise BackendError(url, getattr(e, 'code', 599), str(e))
+        overloaded = is_overload(response.code)
+        backend.release(start, ok=not overloaded)
+        if overloaded:
+            raise BackendError(url, response.code, response.reason)
+        raise gen.Return(AsyncResponse(response))
+
+    @gen.coroutine
+    def _admit_cell(self):
+        # Backpressure: a cell's trace is only synthesized once Valhalla and
+        # the reporter both have room for its requests, so traces are not
+        # built (and held in memory) faster than the backends take them.
+        backends = [
+            self.backend(val.VALHALLA_URL), self.backend(val.REPORTER_URL)]
+        while self._activeCells >= min(
+                int(backend.limit) for backend in backends):
+            yield self._cellsChanged.wait()
+        self._activeCells += 1
+
+    def _release_cell(self):
+        self._activeCells -= 1
+        self._cellsChanged.notify_all()
+
+    @gen.coroutine
+    def get_route_shape(self, routeCoords):
+        route = yield self.get(
+            val.VALHALLA_URL + '/route', val.get_route_params(routeCoords))
+        raise gen.Return(val.parse_route_shape(route))
+
+    @gen.coroutine
+    def get_route_length(self, routeCoords):
+        try:
+            route = yield self.get(
+                val.VALHALLA_URL + '/route',
+                val.get_route_params(routeCoords))
+        except BackendError:
+            raise gen.Return(None)
+        raise gen.Return(val.parse_route_length(route))
+
+    @gen.coroutine
+    def get_trace_attrs(self, shape, **kwargs):
+        matched = yield self.get(
+            val.VALHALLA_URL + '/trace_attributes?',
+            val.get_trace_attrs_params(shape, **kwargs))
+        raise gen.Return(val.parse_trace_attrs(matched))
+
+    @gen.coroutine
+    def get_reporter_segments(self, gpsTrace):
+        report = yield self.get(
+            val.REPORTER_URL + '/report',
+            {"json": val.dumps_report_payload(gpsTrace)})
+        raise gen.Return(val.parse_reporter_segments(report))
+
+    @gen.coroutine
+    def _filter_routes_by_length(self, routeList, minRouteLength,
+                                 maxRouteLength):
+        lengths = yield [self.get_route_length(route) for route in routeList]
+        raise gen.Return([
+            route for route, length in zip(routeList, lengths)
+            if length is not None and
+            minRouteLength < length < maxRouteLength])
+
+    @gen.coroutine
+    def get_POI_routes_by_length(self, locString, minRouteLength,
+                                 maxRouteLength, numResults, apiKey):
+        baseUrl = 'https://maps.googleapis.com/maps/api/place' + \
+            '/textsearch/json?query={0}&radius={1}&key={2}'
+        baseUrl = baseUrl.format("{0} point of interest".format(
+            locString), 25000, apiKey)
+        tokenStr = ''
+        goodRoutes = []
+        sttm = t.time()
+        while (len(goodRoutes) < numResults) & (t.time() - sttm < 300):
+            r = yield self.get(baseUrl + tokenStr)
+            POIs = [{x['name']: {
+                "lat": x['geometry']['location']['lat'],
+                "lon": x['geometry']['location']['lng']}}
+                for x in r.json()['results']]
+            routeList = list(itertools.combinations(POIs, 2))
+            shuffle(routeList)
+            goodRoutes += yield self._filter_routes_by_length(
+                routeList, minRouteLength, maxRouteLength)
+            try:
+                nextPageToken = r.json()['next_page_token']
+                tokenStr = "&pagetoken={0}".format(nextPageToken)
+            except KeyError:
+                break
+        shuffle(goodRoutes)
+        raise gen.Return(goodRoutes[:numResults])
+
+    @gen.coroutine
+    def get_routes_by_length(self, cityStr, minRouteLength, maxRouteLength,
+                             numResults, apiKey):
+        mapzenKey = apiKey
+
+        baseUrl = 'https://search.mapzen.com/v1/search?'
+        cityQuery = \
+            'sources={0}&text={1}&api_key={2}&layer={3}&size=1'.format(
+                'whosonfirst', cityStr, mapzenKey, 'locality')
+        city = yield self.get(baseUrl + cityQuery)
+        cityID = city.json()['features'][0]['properties']['source_id']
+        goodRoutes = []
+        baseUrlCity = 'https://whosonfirst-api.mapzen.com?' + \
+            'api_key={0}&'.format(mapzenKey)
+
+        venueQuery = 'method={0}&id={1}&placetype={2}'.format(
+            'whosonfirst.places.getDescendants', cityID, 'venue') + \
+            '&page=1&per_page=2000'
+        venues = yield self.get(baseUrlCity + venueQuery)
+        venueIDs = [x['wof:id'] for x in venues.json()['places']]
+        shuffle(venueIDs)
+        baseUrlVenues = 'https://whosonfirst-api.mapzen.com?' + \
+            'api_key={0}&page=1&per_page=1&'.format(mapzenKey) + \
+            'extras=geom:latitude,geom:longitude'
+        sttm = t.time()
+
+        for venueChunkIdx in range(0, len(venueIDs), 20):
+            if (len(goodRoutes) >= numResults) | (t.time() - sttm >= 300):
+                break
+            infos = yield [
+                self.get(baseUrlVenues + '&method={0}&id={1}&placetype={2}'
+                         .format('whosonfirst.places.getInfo', venueID,
+                                 'venue'))
+                for venueID in venueIDs[venueChunkIdx:venueChunkIdx + 20]]
+            POIs = []
+            for info in infos:
+                info = info.json()['place']
+                POIs.append({info['wof:name']: {
+                    "lat": info['geom:latitude'],
+                    "lon": info['geom:longitude']}})
+            routeList = list(itertools.combinations(POIs, 2))
+            goodRoutes += yield self._filter_routes_by_length(
+                routeList, minRouteLength, maxRouteLength)
+
+        shuffle(goodRoutes)
+        raise gen.Return(goodRoutes[:numResults])
+
+    @gen.coroutine
+    def score_trace(self, row, dfEdges, jsonDict, sampleRate):
+        # (match, report) -> score for one GPS trace against its true edges;
+        # the match and the report requests go out together
+        (gpsMatchEdges, _, _), (segments, reportUrl) = yield [
+            self.get_trace_attrs(
+                jsonDict['trace'], **val.get_gps_match_kwargs(jsonDict)),
+            self.get_reporter_segments(jsonDict)]
+        if gpsMatchEdges is None or segments is None:
+            raise gen.Return((row, None))
+        row['reporter_url'] = reportUrl
+        if segments == 0:
+            row.update(zip(val.SCORING_METRICS, val.get_no_segment_scores()))
+            raise gen.Return((row, None))
+        scores, segSpeedDf = val.get_cell_scores(
+            segments, dfEdges, gpsMatchEdges, sampleRate,
+            jsonDict['trace']['time'])
+        if len(segSpeedDf) < 1:
+            del row['reporter_url']
+            raise gen.Return((row, None))
+        row.update(zip(val.SCORING_METRICS, scores))
+        raise gen.Return((row, segSpeedDf))
+
+    @gen.coroutine
+    def get_cell_metrics(self, routeName, edges, shapeCoords, noise,
+                         sampleRate, turnPenaltyFactor=500, localEpsg='2768',
+                         speedStore=None, **synthKwargs):
+        # synthesize -> (match, report) -> score for one noise/rate cell
+        row = {'route': routeName, 'noise': noise, 'sample_rate': sampleRate}
+        dfEdges = val.format_edge_df(edges)
+        dfEdges, jsonDict, _ = val.synthesize_trace(
+            dfEdges, shapeCoords, localEpsg, noise=noise,
+            sampleRate=sampleRate, turnPenaltyFactor=turnPenaltyFactor,
+            **synthKwargs)
+        row, segSpeedDf = yield self.score_trace(
+            row, dfEdges, jsonDict, sampleRate)
+        if segSpeedDf is None:
+            raise gen.Return((row, None))
+        segSpeedDf.loc[:, 'route_name'] = routeName
+        segSpeedDf.loc[:, 'sample_rate'] = sampleRate
+        segSpeedDf.loc[:, 'noise'] = noise
+        if speedStore is not None:
+            speedStore.append(segSpeedDf)
+        raise gen.Return((row, segSpeedDf))
+
+    @gen.coroutine
+    def prepare_route(self, rteCoords, turnPenaltyFactor=500):
+        # route -> map_snap once; None if Valhalla has no usable route
+        shape, routeUrl = yield self.get_route_shape(rteCoords)
+        if shape is None:
+            print(routeUrl)
+            raise gen.Return(None)
+        edges, shapeCoords, traceAttrUrl = yield self.get_trace_attrs(
+            shape, shapeMatch="map_snap", turnPenaltyFactor=turnPenaltyFactor)
+        if edges is None:
+            print(traceAttrUrl)
+            raise gen.Return(None)
+        raise gen.Return(val.get_route_record(
+            rteCoords, routeUrl, edges, shapeCoords, traceAttrUrl))
+
+    @gen.coroutine
+    def run_cell(self, route, noise, sampleRate, speedStore=None,
+                 **cellKwargs):
+        # None if the cell failed; it is then kept in failedCells, and
+        # retried later only if the failure was the backend's
+        yield self._admit_cell()
+        try:
+            row, segSpeedDf = yield self.get_cell_metrics(
+                route['name'], route['edges'], route['shape_coords'], noise,
+                sampleRate, speedStore=speedStore, **cellKwargs)
+        except Exception as e:
+            self.failedCells.append({
+                'route': route, 'noise': noise, 'sample_rate': sampleRate,
+                'kwargs': cellKwargs, 'error': str(e),
+                'retryable': isinstance(e, BackendError)})
+            raise gen.Return(None)
+        finally:
+            self._release_cell()
+        row.update(route['cols'])
+        if segSpeedDf is not None:
+            row['avg_density'] = route['avg_density']
+        raise gen.Return((row, segSpeedDf))
+
+    @gen.coroutine
+    def get_route_cells(self, rteCoords, sampleRates, noiseLevels,
+                        turnPenaltyFactor=500, localEpsg='2768',
+                        speedStore=None, **synthKwargs):
+        # route -> map_snap once, then every noise/rate cell concurrently
+        cellKwargs = dict(
+            synthKwargs, turnPenaltyFactor=turnPenaltyFactor,
+            localEpsg=localEpsg)
+        try:
+            route = yield self.prepare_route(rteCoords, turnPenaltyFactor)
+        except Exception as e:
+            self.failedRoutes.append({
+                'route_coords': rteCoords, 'sample_rates': sampleRates,
+                'noise_levels': noiseLevels, 'kwargs': cellKwargs,
+                'error': str(e), 'retryable': isinstance(e, BackendError)})
+            raise gen.Return(([], []))
+        if route is None:
+            raise gen.Return(([], []))
+        if route['multi_segment']:
+            raise gen.Return((val.get_multi_segment_rows(
+                route, sampleRates, noiseLevels), []))
+        cells = yield [
+            self.run_cell(
+                route, round(noise, 3), sampleRate, speedStore, **cellKwargs)
+            for noise in noiseLevels for sampleRate in sampleRates]
+        raise gen.Return(self._collect_cells(cells))
+
+    def _collect_cells(self, cells):
+        cells = [cell for cell in cells if cell is not None]
+        return ([row for row, _ in cells],
+                [df for _, df in cells if df is not None])
+
+    @gen.coroutine
+    def retry_failed(self, speedStore=None):
+        # re-runs every backend failure with its original arguments;
+        # anything that fails again is recorded again
+        failedRoutes = [
+            failed for failed in self.failedRoutes if failed['retryable']]
+        self.failedRoutes = [
+            failed for failed in self.failedRoutes
+            if not failed['retryable']]
+        failedCells = [
+            failed for failed in self.failedCells if failed['retryable']]
+        self.failedCells = [
+            failed for failed in self.failedCells
+            if not failed['retryable']]
+        results = yield [
+            self.get_route_cells(
+                failed['route_coords'], failed['sample_rates'],
+                failed['noise_levels'], speedStore=speedStore,
+                **failed['kwargs'])
+            for failed in failedRoutes]
+        cells = yield [
+            self.run_cell(
+                failed['route'], failed['noise'], failed['sample_rate'],
+                speedStore, **failed['kwargs'])
+            for failed in failedCells]
+        rows, speedDfs = self._collect_cells(cells)
+        for routeRows, routeDfs in results:
+            rows += routeRows
+            speedDfs += routeDfs
+        raise gen.Return((rows, speedDfs))
+
+    @gen.coroutine
+    def get_route_metrics(self, routeList, sampleRates, noiseLevels,
+                          turnPenaltyFactor=500, localEpsg='2768',
+                          speedStore=None, retries=2, retryDelay=10,
+                          **synthKwargs):
+        # same (df, speedDf) as validator.get_route_metrics, minus the
+        # saved trace geojson. Failed cells are retried up to `retries`
+        # times with exponential backoff; any still failing, and cells that
+        # raised anything other than a BackendError, are left in
+        # failedCells / failedRoutes.
+        results = yield [
+            self.get_route_cells(
+                rteCoords, sampleRates, noiseLevels, turnPenaltyFactor,
+                localEpsg, speedStore, **synthKwargs)
+            for rteCoords in routeList]
+        rows = [row for routeRows, _ in results for row in routeRows]
+        speedDfs = [df for _, routeDfs in results for df in routeDfs]
+        for attempt in range(retries):
+            if not any(
+                    failed['retryable'] for failed in
+                    self.failedRoutes + self.failedCells):
+                break
+            yield gen.sleep(retryDelay * 2 ** attempt)
+            retryRows, retryDfs = yield self.retry_failed(speedStore)
+            rows += retryRows
+            speedDfs += retryDfs
+        df = val.format_route_metrics(
+            pd.DataFrame(rows, columns=val.ROUTE_METRIC_COLUMNS))
+        raise gen.Return((df, val.concat_speed_dfs(speedDfs)))
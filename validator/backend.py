@@ -0,0 +1,95 @@
+from __future__ import division
+import time as t
+from collections import deque
+
+import numpy as np
+from tornado import gen
+from tornado.locks import Condition
+
+
+class BackendError(Exception):
+    # a request the backend failed to serve (5xx, 429, timeout, refused);
+    # the cell that made it is recorded for retry rather than scored
+
+    def __init__(self, url, code, reason):
+        super(BackendError, self).__init__(
+            '{0} {1}: {2}'.format(code, reason, url))
+        self.url = url
+        self.code = code
+        self.reason = reason
+
+
+def is_overload(code):
+    # 599 is tornado's code for timeouts and connection errors
+    return code == 429 or code >= 500
+
+
+class BackendHealth(object):
+    # AIMD concurrency limit for one backend host. Each success under
+    # targetLatency adds increase / limit (about +increase per round trip);
+    # an error, or a success slower than targetLatency, multiplies the limit
+    # by decrease, at most once per round trip so a burst of failures from
+    # one overload only backs off once.
+
+    def __init__(self, name, initialLimit=4, minLimit=1, maxLimit=64,
+                 targetLatency=None, increase=1.0, decrease=0.5,
+                 window=200):
+        self.name = name
+        self.limit = float(initialLimit)
+        self.minLimit = minLimit
+        self.maxLimit = maxLimit
+        self.targetLatency = targetLatency
+        self.increase = increase
+        self.decrease = decrease
+        self.inFlight = 0
+        self.waiting = 0
+        self.numRequests = 0
+        self.numErrors = 0
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self._lastDecrease = 0
+        self._changed = Condition()
+
+    @gen.coroutine
+    def acquire(self):
+        self.waiting += 1
+        try:
+            while self.inFlight >= int(self.limit):
+                yield self._changed.wait()
+        finally:
+            self.waiting -= 1
+        self.inFlight += 1
+        raise gen.Return(t.time())
+
+    def release(self, start, ok=True):
+        now = t.time()
+        latency = now - start
+        self.inFlight -= 1
+        self.numRequests += 1
+        self.numErrors += not ok
+        self.latencies.append(latency)
+        self.errors.append(not ok)
+        slow = self.targetLatency is not None and \
+            latency > self.targetLatency
+        if ok and not slow:
+            self.limit = min(
+                self.maxLimit, self.limit + self.increase / self.limit)
+        elif now - self._lastDecrease > np.median(self.latencies):
+            self.limit = max(self.minLimit, self.limit * self.decrease)
+            self._lastDecrease = now
+        self._changed.notify_all()
+
+    def stats(self):
+        latencies = np.asarray(self.latencies)
+        return {
+            'backend': self.name,
+            'limit': round(self.limit, 2),
+            'in_flight': self.inFlight,
+            'waiting': self.waiting,
+            'requests': self.numRequests,
+            'errors': self.numErrors,
+            'error_rate': np.mean(self.errors) if self.errors else 0,
+            'p50_latency': np.percentile(latencies, 50)
+            if len(latencies) else None,
+            'p95_latency': np.percentile(latencies, 95)
+            if len(latencies) else None}
@@ -0,0 +1,392 @@
+from __future__ import division
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from tornado import gen
+from tornado.locks import Condition
+
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+import validator.validator as val
+from validator.async_client import AsyncValidatorClient
+from validator.backend import BackendError
+
+POINT_COLUMNS = ['uuid', 'lat', 'lon', 'time', 'accuracy']
+INGEST_COLUMNS = [
+    'source', 'uuid', 'window_start', 'window_end', 'num_points',
+    'sample_rate'] + val.SCORING_METRICS + ['reporter_url', 'error']
+
+
+def _to_epoch(times):
+    # epoch seconds from numbers or ISO 8601 strings
+    times = pd.Series(times)
+    if pd.api.types.is_numeric_dtype(times):
+        return times.astype(float).values
+    times = pd.to_datetime(times)
+    epoch = times.values.astype('datetime64[ns]').astype(np.int64) / 1e9
+    epoch[pd.isnull(times).values] = np.nan
+    return epoch
+
+
+def _format_points(df):
+    df = df[[col for col in POINT_COLUMNS if col in df.columns]].copy()
+    df['uuid'] = df['uuid'].astype(str)
+    df['time'] = _to_epoch(df['time'])
+    if 'accuracy' not in df:
+        df['accuracy'] = np.nan
+    valid = np.isfinite(df[['lat', 'lon', 'time']].astype(float)).all(axis=1)
+    return df.loc[valid, POINT_COLUMNS]
+
+
+def read_csv_points(path, chunkSize=100000, columns=None):
+    # columns maps the file's column names onto uuid/lat/lon/time/accuracy
+    for chunk in pd.read_csv(path, chunksize=chunkSize):
+        if columns:
+            chunk = chunk.rename(columns=columns)
+        yield _format_points(chunk)
+
+
+def read_jsonl_points(path, chunkSize=100000, columns=None):
+    # one {"uuid": ..., "lat": ..., "lon": ..., "time": ...} point per line
+    points = []
+    with open(path, 'r') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            points.append(json.loads(line))
+            if len(points) >= chunkSize:
+                yield _format_points(
+                    pd.DataFrame(points).rename(columns=columns or {}))
+                points = []
+    if points:
+        yield _format_points(
+            pd.DataFrame(points).rename(columns=columns or {}))
+
+
+def read_gpx_points(path, chunkSize=100000, columns=None):
+    # Every <trk> is one trace, named by its <name> or by file and track
+    # number. Elements are cleared as they are parsed.
+    baseName = os.path.splitext(os.path.basename(path))[0]
+    points = []
+    tags = []
+    numTracks = 0
+    uuid = None
+    for event, elem in iterparse(path, events=('start', 'end')):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if event == 'start':
+            tags.append(tag)
+            if tag == 'trk':
+                uuid = '{0}_{1}'.format(baseName, numTracks)
+                numTracks += 1
+            continue
+        tags.pop()
+        if tag == 'name' and tags and tags[-1] == 'trk' and elem.text:
+            uuid = elem.text.strip()
+        elif tag == 'trkpt':
+            timeElem = [
+                child for child in elem
+                if child.tag.rsplit('}', 1)[-1] == 'time']
+            points.append({
+                'uuid': uuid, 'lat': float(elem.get('lat')),
+                'lon': float(elem.get('lon')),
+                'time': timeElem[0].text if timeElem else None})
+            elem.clear()
+            if len(points) >= chunkSize:
+                yield _format_points(pd.DataFrame(points))
+                points = []
+        elif tag == 'trk':
+            elem.clear()
+    if points:
+        yield _format_points(pd.DataFrame(points))
+
+
+def read_trace_points(path, chunkSize=100000, columns=None):
+    ext = os.path.splitext(path)[1].lower()
+    readers = {
+        '.csv': read_csv_points, '.jsonl': read_jsonl_points,
+        '.ndjson': read_jsonl_points, '.gpx': read_gpx_points}
+    if ext not in readers:
+        raise ValueError('Unsupported trace file: {0}'.format(path))
+    return readers[ext](path, chunkSize=chunkSize, columns=columns)
+
+
+def _split_trace(points, windowSeconds, maxGap):
+    # start offsets of the windows in one uuid's time-ordered points: a new
+    # window at every gap longer than maxGap or every windowSeconds
+    times = points['time']
+    gaps = np.concatenate(([True], np.diff(times) > maxGap))
+    runStarts = times[np.maximum.accumulate(
+        np.where(gaps, np.arange(len(times)), 0))]
+    windowIdx = np.floor((times - runStarts) / windowSeconds)
+    return np.flatnonzero(
+        gaps | np.concatenate(([True], np.diff(windowIdx) != 0)))
+
+
+def _make_window(uuid, points, minPoints=1):
+    # windows shorter than minPoints carry an error instead of being scored
+    trace = np.empty(len(points['time']), dtype=val.TRACE_DTYPE)
+    trace['lat'] = points['lat']
+    trace['lon'] = points['lon']
+    trace['time'] = points['time']
+    accuracy = points['accuracy']
+    accuracy = accuracy[~np.isnan(accuracy)]
+    window = {
+        'uuid': uuid, 'trace': trace,
+        'accuracy': float(np.median(accuracy)) if len(accuracy) else None}
+    if len(trace) < minPoints:
+        window['error'] = 'Only {0} points, fewer than minPoints ({1}).' \
+            .format(len(trace), minPoints)
+    return window
+
+
+def iter_trace_windows(chunks, windowSeconds=900, maxGap=120, minPoints=10,
+                       idleChunks=None):
+    # Groups a stream of point chunks by uuid and cuts each uuid's points
+    # into time windows. Points must be time-ordered within a uuid. Only
+    # the open window of each uuid is held between chunks. It is closed
+    # once the uuid is absent from a chunk and the stream clock (the
+    # chunk's latest time) is more than maxGap past its last point, so
+    # sparse reporters in time-sorted archives stay in one window. In an
+    # archive sorted by uuid the clock jumps around, and a finished uuid
+    # can stay open until the end of the stream; pass idleChunks=1 there
+    # to close each uuid as soon as a chunk without it arrives, so only
+    # one window is open at a time. Windows with fewer than minPoints
+    # fixes are yielded with an 'error'.
+    buffers = {}
+    idle = {}
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        seen = set()
+        for uuid, group in chunk.groupby('uuid', sort=False):
+            seen.add(uuid)
+            idle[uuid] = 0
+            points = group.sort_values('time', kind='mergesort')
+            points = {
+                col: points[col].values.astype(float)
+                for col in ['lat', 'lon', 'time', 'accuracy']}
+            if uuid in buffers:
+                points = {
+                    col: np.concatenate((buffers[uuid][col], values))
+                    for col, values in points.items()}
+            starts = _split_trace(points, windowSeconds, maxGap)
+            bounds = list(zip(starts, np.append(
+                starts[1:], len(points['time']))))
+            for start, stop in bounds[:-1]:
+                yield _make_window(uuid, {
+                    col: values[start:stop]
+                    for col, values in points.items()}, minPoints)
+            start = bounds[-1][0]
+            buffers[uuid] = {
+                col: values[start:] for col, values in points.items()}
+        clock = chunk['time'].max()
+        for uuid in [uuid for uuid in buffers if uuid not in seen]:
+            idle[uuid] += 1
+            if clock - buffers[uuid]['time'][-1] > maxGap or (
+                    idleChunks is not None and idle[uuid] >= idleChunks):
+                del idle[uuid]
+                yield _make_window(uuid, buffers.pop(uuid), minPoints)
+    for uuid, points in buffers.items():
+        yield _make_window(uuid, points, minPoints)
+
+
+def load_truth_routes(path):
+    # JSONL of {"uuid": ..., "shape": encoded polyline or [[lon, lat], ...]}
+    truth = {}
+    with open(path, 'r') as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            shape = record['shape']
+            if not isinstance(shape, list):
+                shape = val.decode(shape)
+            truth[str(record['uuid'])] = np.asarray(shape, dtype=float)
+    return truth
+
+
+def clip_truth_shape(truthCoords, trace):
+    # The part of the true route between the shape vertices nearest the
+    # window's first and last fix, or None if the window runs backwards
+    # along it (i.e. does not belong to this route).
+    coords = np.asarray(truthCoords, dtype=float)
+    cosLat = np.cos(np.radians(coords[:, 1].mean()))
+
+    def nearest(lon, lat):
+        return np.argmin(
+            ((coords[:, 0] - lon) * cosLat) ** 2 + (coords[:, 1] - lat) ** 2)
+
+    first = nearest(trace['lon'][0], trace['lat'][0])
+    last = nearest(trace['lon'][-1], trace['lat'][-1])
+    if last <= first:
+        return None
+    return coords[first:last + 1]
+
+
+def get_window_payload(window, gpsAccuracy=5, mode="auto",
+                       turnPenaltyFactor=0, breakageDist=2000, beta=3,
+                       sigmaZ=4.07, searchRadius=50):
+    # the reporter request synthesize_trace would build, for a real trace
+    accuracy = window['accuracy'] or gpsAccuracy
+    return {
+        "uuid": window['uuid'], "trace": window['trace'],
+        "shape_match": "map_snap",
+        "match_options": {
+            "mode": mode,
+            "turn_penalty_factor": turnPenaltyFactor,
+            "breakage_distance": breakageDist,
+            "beta": beta,
+            "sigma_z": sigmaZ,
+            "search_radius": searchRadius,
+            "gps_accuracy": round(min(100, accuracy), 2)}}
+
+
+@gen.coroutine
+def score_window(client, window, truthCoords, source=None,
+                 turnPenaltyFactor=500, **matchKwargs):
+    # speeds are timed from the trace timestamps (see get_speed_scores);
+    # sample_rate is the mean interval and only labels the row
+    trace = window['trace']
+    times = trace['time']
+    sampleRate = float(times[-1] - times[0]) / max(len(times) - 1, 1)
+    row = {
+        'source': source, 'uuid': window['uuid'],
+        'window_start': times[0], 'window_end': times[-1],
+        'num_points': len(trace), 'sample_rate': sampleRate}
+    if truthCoords is None:
+        row['error'] = 'No ground truth route.'
+        raise gen.Return((row, None))
+    if sampleRate <= 0:
+        row['error'] = 'Window has no elapsed time.'
+        raise gen.Return((row, None))
+    shape = clip_truth_shape(truthCoords, trace)
+    if shape is None:
+        row['error'] = 'Window does not follow the ground truth route.'
+        raise gen.Return((row, None))
+    edges, _, reason = yield client.get_trace_attrs(
+        val.encode_polyline(shape[:, 0], shape[:, 1]),
+        shapeMatch="map_snap", turnPenaltyFactor=turnPenaltyFactor)
+    if edges is None:
+        row['error'] = 'Ground truth route did not match: {0}'.format(
+            reason)
+        raise gen.Return((row, None))
+    dfEdges = val.format_edge_df(edges)
+    jsonDict = get_window_payload(
+        window, turnPenaltyFactor=turnPenaltyFactor, **matchKwargs)
+    row, segSpeedDf = yield client.score_trace(
+        row, dfEdges, jsonDict, sampleRate)
+    if segSpeedDf is not None:
+        segSpeedDf.loc[:, 'route_name'] = window['uuid']
+        segSpeedDf.loc[:, 'sample_rate'] = sampleRate
+        segSpeedDf.loc[:, 'noise'] = np.nan
+    raise gen.Return((row, segSpeedDf))
+
+
+class ScoreWriter(object):
+    # appends score rows (and segment speed errors) to CSV files in
+    # batches, so results land on disk as the stream is processed
+
+    def __init__(self, scoresPath, speedPath=None, flushEvery=100):
+        self.scoresPath = scoresPath
+        self.speedPath = speedPath
+        self.flushEvery = flushEvery
+        self.numRows = 0
+        self._rows = []
+        self._speedDfs = []
+        self._header = {scoresPath: True, speedPath: True}
+
+    def write(self, row, segSpeedDf=None):
+        self._rows.append(row)
+        if segSpeedDf is not None and self.speedPath:
+            self._speedDfs.append(segSpeedDf)
+        self.numRows += 1
+        if len(self._rows) >= self.flushEvery:
+            self.flush()
+
+    def _append(self, path, df):
+        df.to_csv(path, mode='w' if self._header[path] else 'a',
+                  header=self._header[path], index=False)
+        self._header[path] = False
+
+    def flush(self):
+        if self._rows:
+            self._append(self.scoresPath, pd.DataFrame(
+                self._rows, columns=INGEST_COLUMNS))
+            self._rows = []
+        if self._speedDfs:
+            self._append(self.speedPath, val.concat_speed_dfs(self._speedDfs))
+            self._speedDfs = []
+
+
+@gen.coroutine
+def score_trace_files(paths, truth, scoresPath, speedPath=None, client=None,
+                      maxInFlight=32, retries=2, retryDelay=10,
+                      chunkSize=100000, columns=None, windowSeconds=900,
+                      maxGap=120, minPoints=10, idleChunks=None,
+                      speedStore=None, **matchKwargs):
+    # Streams real GPS traces through the same map_snap -> (match, report)
+    # -> score path as the synthetic sweep. truth maps a uuid to its true
+    # route coordinates (see load_truth_routes). At most maxInFlight windows
+    # are scored at once, on top of the client's per-backend limits; file
+    # reading pauses until a window finishes. Returns the number of windows
+    # written to scoresPath.
+    client = client or AsyncValidatorClient()
+    writer = ScoreWriter(scoresPath, speedPath)
+    done = Condition()
+    state = {'in_flight': 0}
+
+    def error_row(window, source, error):
+        return {
+            'source': source, 'uuid': window['uuid'],
+            'window_start': window['trace']['time'][0],
+            'window_end': window['trace']['time'][-1],
+            'num_points': len(window['trace']), 'error': str(error)}
+
+    @gen.coroutine
+    def run(window, source):
+        # never raises: a window that cannot be scored is written with its
+        # error so nothing is silently dropped from the output
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    row, segSpeedDf = yield score_window(
+                        client, window, truth.get(window['uuid']), source,
+                        **matchKwargs)
+                    break
+                except BackendError as e:
+                    if attempt == retries:
+                        row, segSpeedDf = error_row(window, source, e), None
+                    else:
+                        yield gen.sleep(retryDelay * 2 ** attempt)
+                except Exception as e:
+                    row, segSpeedDf = error_row(window, source, e), None
+                    break
+            writer.write(row, segSpeedDf)
+            if segSpeedDf is not None and speedStore is not None:
+                speedStore.append(segSpeedDf)
+        finally:
+            state['in_flight'] -= 1
+            done.notify_all()
+
+    for path in paths:
+        windows = iter_trace_windows(
+            read_trace_points(path, chunkSize, columns), windowSeconds,
+            maxGap, minPoints, idleChunks)
+        for window in windows:
+            if 'error' in window:
+                writer.write(error_row(
+                    window, os.path.basename(path), window['error']))
+                continue
+            while state['in_flight'] >= maxInFlight:
+                yield done.wait()
+            state['in_flight'] += 1
+            run(window, os.path.basename(path))
+    while state['in_flight'] > 0:
+        yield done.wait()
+    writer.flush()
+    raise gen.Return(writer.numRows)
@@ -0,0 +1,177 @@
+from __future__ import division
+import numpy as np
+from geojson import Feature, FeatureCollection
+from ipywidgets import Layout
+from ipyleaflet import (
+    Map,
+    TileLayer,
+    Circle,
+    GeoJSON
+)
+from pyproj import Proj, transform
+
+import validator.validator as val
+
+
+def simplify_indices(xy, tolerance):
+    # Douglas-Peucker over an ordered point sequence, returned as a mask so
+    # that parallel point sets (true, gps, displacement) stay aligned
+    numPts = len(xy)
+    keep = np.zeros(numPts, dtype=bool)
+    if numPts < 3:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, numPts - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        seg = xy[last] - xy[first]
+        pts = xy[first + 1:last] - xy[first]
+        segLen = np.hypot(seg[0], seg[1])
+        if segLen == 0:
+            dists = np.hypot(pts[:, 0], pts[:, 1])
+        else:
+            dists = np.abs(seg[0] * pts[:, 1] - seg[1] * pts[:, 0]) / segLen
+        idx = np.argmax(dists)
+        if dists[idx] > tolerance:
+            split = first + 1 + idx
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def get_meters_per_pixel(lat, zoomLevel):
+    return 156543.03392 * np.cos(np.radians(lat)) / 2 ** zoomLevel
+
+
+def get_point_circles(coords, radius=10, numSides=12):
+    # circles as polygons so a whole point set fits in a single GeoJSON layer
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    angles = np.linspace(0, 2 * np.pi, numSides + 1)
+    dLat = radius / 111320.0 * np.sin(angles)
+    dLon = radius / 111320.0 * np.cos(angles)
+    lons = coords[:, [0]] + dLon / np.cos(np.radians(coords[:, [1]]))
+    lats = coords[:, [1]] + dLat
+    rings = np.round(np.dstack((lons, lats)), 6)
+    return [[ring] for ring in rings.tolist()]
+
+
+def get_simplified_trace_features(data, zoomLevel, localEpsg='2768',
+                                  pixelTolerance=2):
+    mProj = Proj(init='epsg:{0}'.format(localEpsg))
+    llProj = Proj(init='epsg:4326')
+
+    def projected(coords):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        x, y = transform(llProj, mProj, coords[:, 0], coords[:, 1])
+        return np.column_stack((x, y))
+
+    def point_layer(feature, mask, color):
+        coords = np.asarray(feature['geometry']['coordinates'])[mask]
+        return Feature(geometry={
+            "type": "MultiPolygon",
+            "coordinates": get_point_circles(coords)}, properties={
+            "name": feature['properties'].get('name'),
+            "style": {
+                "color": color, "weight": 1, "opacity": 1.0,
+                "fillOpacity": 0.4, "fillColor": color}})
+
+    anyFeature = data[[name for name in val.TRACE_FEATURES if name in data][0]]
+    ctrLat = np.mean(np.asarray(
+        anyFeature['geometry']['coordinates'], dtype=float).reshape(-1, 2)[
+        :, 1])
+    tolerance = pixelTolerance * get_meters_per_pixel(ctrLat, zoomLevel)
+
+    simplified = {}
+    for name in ['true_route_coords', 'matched_gps_route']:
+        if name in data:
+            coords = data[name]['geometry']['coordinates']
+            mask = simplify_indices(projected(coords), tolerance)
+            simplified[name] = Feature(geometry={
+                "type": "LineString",
+                "coordinates": np.asarray(coords)[mask].tolist()},
+                properties=data[name]['properties'])
+
+    pointSource = 'resampled_coords' if 'resampled_coords' in data \
+        else 'gps_coords'
+    if pointSource not in data:
+        return simplified
+    mask = simplify_indices(projected(
+        data[pointSource]['geometry']['coordinates']), tolerance)
+    if 'resampled_coords' in data:
+        simplified['resampled_coords'] = point_layer(
+            data['resampled_coords'], mask, '#ff0000')
+    if 'gps_coords' in data:
+        simplified['gps_coords'] = point_layer(
+            data['gps_coords'], mask, '#0000ff')
+    if 'displacement_lines' in data:
+        lines = data['displacement_lines']['geometry']['coordinates']
+        simplified['displacement_lines'] = Feature(geometry={
+            "type": "MultiLineString",
+            "coordinates": [
+                line for line, keep in zip(lines, mask) if keep]},
+            properties=data['displacement_lines']['properties'])
+    return simplified
+
+
+def generate_route_map(pathToGeojson, zoomLevel=11, mode='auto',
+                       features=None, localEpsg='2768', maxWidgets=500,
+                       pixelTolerance=2):
+
+    data = val.load_trace_features(pathToGeojson, features)
+    names = [name for name in val.TRACE_FEATURES if name in data]
+    if mode == 'auto':
+        numPts = sum(
+            len(data[name]['geometry']['coordinates']) for name in
+            ['resampled_coords', 'gps_coords'] if name in data)
+        mode = 'circles' if numPts <= maxWidgets else 'geojson'
+    ctrLon, ctrLat = np.mean(np.asarray(
+        data[names[0]]['geometry']['coordinates'], dtype=float).reshape(
+        -1, 2), axis=0)
+    url = "http://stamen-tiles-{s}.a.ssl.fastly.net/toner-lite/{z}/{x}/{y}.png"
+    provider = TileLayer(url=url, opacity=1)
+    center = [ctrLat, ctrLon]
+    m = Map(default_tiles=provider, center=center, zoom=zoomLevel)
+    m.layout = Layout(width='100%', height='800px')
+
+    if mode == 'geojson':
+        layers = {}
+        cache = {}
+
+        def draw(zoom):
+            if zoom not in cache:
+                cache[zoom] = get_simplified_trace_features(
+                    data, zoom, localEpsg, pixelTolerance)
+            for name in val.TRACE_FEATURES:
+                if name not in cache[zoom]:
+                    continue
+                feature = cache[zoom][name]
+                if name in layers:
+                    layers[name].data = FeatureCollection([feature])
+                else:
+                    layers[name] = GeoJSON(data=FeatureCollection([feature]))
+                    m.add_layer(layers[name])
+
+        draw(zoomLevel)
+        m.observe(lambda change: draw(int(change['new'])), names='zoom')
+        return m
+
+    lines = [data[name] for name in ['true_route_coords', 'matched_gps_route']
+             if name in data]
+    if lines:
+        m.add_layer(GeoJSON(data=FeatureCollection(lines)))
+    for name, color in [('resampled_coords', '#ff0000'),
+                        ('gps_coords', '#0000ff')]:
+        if name not in data:
+            continue
+        for coords in data[name]['geometry']['coordinates']:
+            cm = Circle(
+                location=coords[::-1], radius=10, weight=1, color=color,
+                opacity=1.0, fill_opacity=0.4, fill_color=color)
+            m.add_layer(cm)
+    if 'displacement_lines' in data:
+        m.add_layer(GeoJSON(data=data['displacement_lines']))
+    return m
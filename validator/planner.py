@@ -0,0 +1,145 @@
+from __future__ import division
+import heapq
+from multiprocessing import Pool
+from random import Random
+
+import numpy as np
+import pandas as pd
+
+import validator.validator as val
+
+_ROUTES = []
+_CELL_KWARGS = {}
+
+
+def stratify_routes(routeList, bandEdges, perBand, lengths=None, seed=None):
+    # Draws up to perBand routes at random from each route length band, so a
+    # sweep is not dominated by whichever lengths the POI search returns
+    # most often. bandEdges are ascending lengths in km, e.g. [1, 2, 3, 4, 5]
+    # for four 1 km bands; routes outside them are dropped.
+    if lengths is None:
+        lengths = [val.get_route_length(route) for route in routeList]
+    lengths = np.array(
+        [np.nan if length is None else length for length in lengths],
+        dtype=float)
+    bands = np.digitize(lengths, bandEdges)
+    rng = Random(seed)
+    sampled = []
+    for band in range(1, len(bandEdges)):
+        idxs = list(np.flatnonzero(bands == band))
+        rng.shuffle(idxs)
+        sampled += [routeList[i] for i in sorted(idxs[:perBand])]
+    return sampled
+
+
+def estimate_cell_cost(route, sampleRate, sampleWeight=1.0):
+    # Densifying the route is linear in its shape points; synthesizing,
+    # matching and reporting the trace are linear in the number of fixes,
+    # i.e. route duration / sample rate. sampleWeight is the cost of one fix
+    # relative to one shape point and can be calibrated from the benchmarks.
+    return route['num_shape_pts'] + \
+        sampleWeight * route['duration'] / sampleRate
+
+
+def plan_sweep(routes, sampleRates, noiseLevels, sampleWeight=1.0):
+    # every (route, noise, sample rate) cell with its estimated cost,
+    # longest first; 'order' is the cell's position in get_route_metrics
+    cells = []
+    for i, route in enumerate(routes):
+        for j, noise in enumerate(noiseLevels):
+            for k, sampleRate in enumerate(sampleRates):
+                cells.append({
+                    'route': i, 'noise': round(noise, 3),
+                    'sample_rate': sampleRate,
+                    'order': (route.get('position', i), j, k),
+                    'cost': estimate_cell_cost(
+                        route, sampleRate, sampleWeight)})
+    return sorted(cells, key=lambda cell: (-cell['cost'], cell['order']))
+
+
+def assign_cells(cells, numWorkers):
+    # Longest-processing-time-first: each cell goes to the least loaded
+    # worker. For chunked sweeps run on separate machines/containers.
+    loads = [(0, w) for w in range(numWorkers)]
+    assignments = [[] for _ in range(numWorkers)]
+    for cell in sorted(cells, key=lambda cell: -cell['cost']):
+        load, w = heapq.heappop(loads)
+        assignments[w].append(cell)
+        heapq.heappush(loads, (load + cell['cost'], w))
+    return assignments
+
+
+def _init_worker(routes, cellKwargs):
+    global _ROUTES, _CELL_KWARGS
+    # forked workers inherit the parent's random state; without a reseed
+    # they would all draw the same GPS noise
+    np.random.seed()
+    _ROUTES = routes
+    _CELL_KWARGS = cellKwargs
+
+
+def _run_cell(cell):
+    route = _ROUTES[cell['route']]
+    row, segSpeedDf, _ = val.get_cell_metrics(
+        route['name'], route['edges'], route['shape_coords'], cell['noise'],
+        cell['sample_rate'], **_CELL_KWARGS)
+    return cell, row, segSpeedDf
+
+
+def get_planned_route_metrics(routeList, sampleRates, noiseLevels,
+                              processes=None, turnPenaltyFactor=500,
+                              localEpsg='2768', speedStore=None,
+                              sampleWeight=1.0, **synthKwargs):
+    # Same (df, speedDf) as get_route_metrics, minus the saved trace geojson.
+    # Cells are handed to the pool one at a time, longest first, so the
+    # expensive long-route/high-rate cells start early and the short ones
+    # fill in behind them instead of straggling at the end.
+    routes = []
+    rows = []
+    for position, rteCoords in enumerate(routeList):
+        route = val.prepare_route(rteCoords, turnPenaltyFactor)
+        if route is None:
+            continue
+        route['position'] = position
+        if route['multi_segment']:
+            rows += [
+                ((position, j, 0), row) for j, row in enumerate(
+                    val.get_multi_segment_rows(
+                        route, sampleRates, noiseLevels))]
+        else:
+            routes.append(route)
+
+    cells = plan_sweep(routes, sampleRates, noiseLevels, sampleWeight)
+    cellKwargs = dict(
+        synthKwargs, turnPenaltyFactor=turnPenaltyFactor,
+        localEpsg=localEpsg)
+    speedDfs = []
+    pool = Pool(processes=processes, initializer=_init_worker,
+                initargs=(routes, cellKwargs))
+    try:
+        for n, (cell, row, segSpeedDf) in enumerate(
+                pool.imap_unordered(_run_cell, cells, chunksize=1)):
+            print(
+                "Cell {0}/{1} // Route: {2} // Noise Level: {3} // "
+                "Sample Rate: {4}".format(
+                    n + 1, len(cells), cell['route'], cell['noise'],
+                    cell['sample_rate']))
+            route = routes[cell['route']]
+            row.update(route['cols'])
+            if segSpeedDf is not None:
+                row['avg_density'] = route['avg_density']
+                speedDfs.append((cell['order'], segSpeedDf))
+                if speedStore is not None:
+                    speedStore.append(segSpeedDf)
+            rows.append((cell['order'], row))
+    finally:
+        pool.close()
+        pool.join()
+
+    df = pd.DataFrame(
+        [row for _, row in sorted(rows, key=lambda item: item[0])],
+        columns=val.ROUTE_METRIC_COLUMNS)
+    speedDfs = [
+        segSpeedDf for _, segSpeedDf in sorted(
+            speedDfs, key=lambda item: item[0])]
+    return val.format_route_metrics(df), val.concat_speed_dfs(speedDfs)
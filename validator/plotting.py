@@ -0,0 +1,160 @@
+from __future__ import division
+import numpy as np
+from matplotlib import pyplot as plt
+
+import validator.validator as val
+
+
+def render_segment_match_boxplot(data, sampleRate, fig, ax):
+    Hz = round(1 / sampleRate, 3)
+    data.boxplot(column='distance traveled', by='noise', ax=ax, grid=True)
+    ax.set_ylim(0, 3)
+    ax.set_xlabel('Noise (m)', fontsize=15)
+    ax.set_ylabel('Match rate', fontsize=15)
+    ax.set_title('Sample Rate: {0} Hz'.format(Hz), fontsize=20)
+    fig.suptitle('')
+
+
+def plot_segment_match_boxplots(df, sampleRates, saveFig=True):
+    for rate in sampleRates:
+        Hz = round(1 / rate, 3)
+        fig, ax = plt.subplots(figsize=(12, 8))
+        render_segment_match_boxplot(
+            val.get_segment_match_data(df, rate), rate, fig, ax)
+        if saveFig:
+            fig.savefig('./../data/score_vs_noise_{0}_Hz.png'.format(Hz))
+
+
+def render_distance_metrics(data, sampleRates, fig, axarr):
+
+    norm = plt.Normalize()
+    cmap = plt.get_cmap('RdYlBu_r')
+    colors = cmap(norm(sampleRates))
+    metricArr = np.asarray(val.DISTANCE_METRICS).reshape((3, 2))
+    for i, row in enumerate(axarr):
+        for j, col in enumerate(row):
+            metric = metricArr[i, j]
+            for k, rate in enumerate(sampleRates):
+                axarr[i, j].plot(
+                    data.loc[data['sample_rate'] == rate, 'noise'],
+                    data.loc[data['sample_rate'] == rate, metric],
+                    label=str(round(1 / rate, 3)) + ' Hz', alpha=0.7,
+                    color=colors[k])
+            axarr[i, j].legend(title='Sample Rate')
+            axarr[i, j].set_title(metric)
+
+    ax = fig.add_subplot(111, frameon=False)
+    ax.tick_params(
+        labelcolor='none', top='off', bottom='off', left='off', right='off')
+    ax.set_xlabel('Noise (m)', fontsize=15)
+    ax.set_ylabel('Match Error Rate', fontsize=15)
+
+
+def plot_distance_metrics(df, sampleRates, saveFig=True):
+
+    fig, axarr = plt.subplots(3, 2, sharex=True, figsize=(16, 16))
+    render_distance_metrics(
+        val.get_distance_metric_data(df), sampleRates, fig, axarr)
+    if saveFig:
+        fig.savefig('match_errors_by_sample_rate.png')
+
+
+def render_speed_error_cdfs(cdfs, fig, ax):
+    errorAtMaxDiff = cdfs['threshold']
+    truePositiveRate = cdfs['true_positive_rate']
+    truePostiveRateStr = np.round(truePositiveRate * 100, 1)
+    falsePositiveRate = cdfs['false_positive_rate']
+    falsePostiveRateStr = np.round(falsePositiveRate * 100, 1)
+    maxDiffPctStr = np.round((errorAtMaxDiff * 100), 1)
+
+    ax.plot(cdfs['bins'], cdfs['match_cdf'], color='b',
+            label='matched segments')
+    ax.plot(cdfs['bins'], cdfs['miss_cdf'], color='r',
+            label='unmatched segments')
+    ax.set_ylim(-0.01, 1.01)
+    ax.axvline(errorAtMaxDiff, linewidth=0.5, color='r')
+    ax.annotate(
+        'True Positive Rate: {0}%'.format(truePostiveRateStr),
+        xy=(errorAtMaxDiff, truePositiveRate), xytext=(0.6, 0.75),
+        textcoords='figure fraction', arrowprops=dict(
+            width=0.05, facecolor='black'))
+    ax.annotate(
+        'False Positive Rate: {0}%'.format(falsePostiveRateStr),
+        xy=(errorAtMaxDiff, falsePositiveRate), xytext=(0.6, 0.5),
+        textcoords='figure fraction', arrowprops=dict(
+            width=0.05, facecolor='black'))
+    ax.annotate(
+        'Optimal Error Threshold: {0}%'.format(maxDiffPctStr),
+        xy=(errorAtMaxDiff, 0.1), xytext=(0.6, 0.25),
+        textcoords='figure fraction', arrowprops=dict(
+            width=0.05, facecolor='black'))
+    ax2 = ax.twinx()
+    ax2.plot(cdfs['bins'], cdfs['diff'], linewidth=1, color='k',
+             linestyle='--', label='Frequency Difference')
+    ax2.legend(loc='lower right')
+    ax2.set_ylabel('Difference in Cumulative Frequency', fontsize=15)
+    ax.legend(loc='upper right')
+    ax.set_xlim(-1, 10)
+    ax.set_xlabel("% Error: Segment Speed", fontsize=15)
+    ax.set_ylabel("Cumulative Frequency", fontsize=15)
+
+
+def get_optimal_speed_error_threshold(speedDf, plot=True, saveFig=True):
+    cdfs = val.get_speed_error_cdfs(speedDf)
+    if not (plot or saveFig):
+        return cdfs['threshold']
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    render_speed_error_cdfs(cdfs, fig, ax)
+    if not plot:
+        plt.close()
+    else:
+        plt.show()
+    if saveFig:
+        fig.savefig('speed_error_cdfs.png')
+
+    return cdfs['threshold']
+
+
+def render_accuracy_heatmap(accMat, sampleRates, noiseLevels, fig, ax):
+    im = ax.imshow(accMat, interpolation='none', extent=[
+        min(noiseLevels), max(noiseLevels), max(sampleRates),
+        min(sampleRates)])
+    fig.colorbar(im, ax=ax, fraction=0.02)
+    ax.set_xlabel("noise", fontsize=15)
+    ax.set_ylabel("sample rate", fontsize=15)
+    ax.set_yticks(
+        np.arange(min(sampleRates), max(sampleRates), len(sampleRates)))
+    ax.set_yticklabels([''] + [str(int(rate)) for rate in sampleRates])
+    ax.set_title("Accuracy at Optimal Error Threshold", fontsize=15)
+
+
+def plot_accuracy_heatmap(speedDf, thresholds, sampleRates,
+                          noiseLevels, saveFig=True):
+    accMat = val.get_accuracy_matrix(
+        speedDf, thresholds, sampleRates, noiseLevels)
+    fig, ax = plt.subplots(figsize=(12, 12))
+    render_accuracy_heatmap(accMat, sampleRates, noiseLevels, fig, ax)
+    plt.show()
+    if saveFig:
+        fig.savefig('map_matching_acc_at_threshold.png')
+    return accMat
+
+
+def plot_change_in_acc(oneSizeFitsAllAcc, rateSpecificAcc, sampleRates,
+                       noiseLevels):
+    fig, ax = plt.subplots(figsize=(12, 12))
+    ax.set_xlabel("noise", fontsize=15)
+    ax.set_ylabel("sample rate", fontsize=15)
+    ax.set_yticks(
+        np.arange(min(sampleRates), max(sampleRates), len(sampleRates)))
+    ax.set_yticklabels([''] + [str(int(rate)) for rate in sampleRates])
+    accDiff = rateSpecificAcc - oneSizeFitsAllAcc
+    limit = np.max(np.abs(accDiff))
+    im = ax.imshow(
+        accDiff, cmap='RdYlGn', vmin=-limit, vmax=limit,
+        extent=[min(noiseLevels), max(noiseLevels),
+                max(sampleRates), min(sampleRates)])
+    ax.set_title(
+        "Change in Accuracy Using Rate-Specific Thresholds", fontsize=15)
+    fig.colorbar(im, ax=ax, fraction=0.02)
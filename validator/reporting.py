@@ -0,0 +1,139 @@
+from __future__ import division
+import os
+import re
+from multiprocessing import Pool
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+import validator.plotting as plotting
+import validator.validator as val
+
+FIGSIZES = {
+    'distance_metrics': (16, 16),
+    'speed_error_cdfs': (12, 8),
+    'accuracy_heatmap': (12, 12),
+    'segment_match_boxplot': (12, 8)}
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def _init_worker():
+    from matplotlib import pyplot as plt
+    plt.switch_backend('Agg')
+
+
+def _render_figure(job):
+    from matplotlib import pyplot as plt
+    kind, args, path = job
+    if kind == 'distance_metrics':
+        fig, ax = plt.subplots(3, 2, sharex=True, figsize=FIGSIZES[kind])
+    else:
+        fig, ax = plt.subplots(figsize=FIGSIZES[kind])
+    getattr(plotting, 'render_' + kind)(*(tuple(args) + (fig, ax)))
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def get_city_report_data(matchDf, speedDf, sampleRates, noiseLevels):
+    cdfs = val.get_speed_error_cdfs(speedDf)
+    thresholdsByRate = [
+        val.get_speed_error_cdfs(
+            speedDf[speedDf['sample_rate'] == rate])['threshold']
+        for rate in sampleRates]
+    return {
+        'distance_metrics': val.get_distance_metric_data(matchDf),
+        'speed_error_cdfs': cdfs,
+        'thresholds_by_rate': thresholdsByRate,
+        'accuracy': val.get_accuracy_matrix(
+            speedDf, [cdfs['threshold']], sampleRates, noiseLevels),
+        'accuracy_by_rate': val.get_accuracy_matrix(
+            speedDf, thresholdsByRate, sampleRates, noiseLevels),
+        'segment_match': [
+            val.get_segment_match_data(matchDf, rate)
+            for rate in sampleRates]}
+
+
+def _city_jobs(cityDir, data, sampleRates, noiseLevels):
+    jobs = [
+        ('distance_metrics', (data['distance_metrics'], sampleRates),
+         os.path.join(cityDir, 'match_errors_by_sample_rate.png')),
+        ('speed_error_cdfs', (data['speed_error_cdfs'],),
+         os.path.join(cityDir, 'speed_error_cdfs.png')),
+        ('accuracy_heatmap', (data['accuracy'], sampleRates, noiseLevels),
+         os.path.join(cityDir, 'map_matching_acc_at_threshold.png')),
+        ('accuracy_heatmap',
+         (data['accuracy_by_rate'], sampleRates, noiseLevels),
+         os.path.join(cityDir, 'map_matching_acc_at_rate_threshold.png'))]
+    for rate, rateData in zip(sampleRates, data['segment_match']):
+        jobs.append((
+            'segment_match_boxplot', (rateData, rate),
+            os.path.join(cityDir, 'score_vs_noise_{0}_Hz.png'.format(
+                round(1 / rate, 3)))))
+    return jobs
+
+
+def write_html_summary(outDir, cityData, cityFigures):
+    rows = []
+    for city in sorted(cityData):
+        data = cityData[city]
+        cdfs = data['speed_error_cdfs']
+        cells = ''.join(
+            '<td><a href="{0}"><img src="{0}" width="240"></a></td>'.format(
+                escape(os.path.relpath(path, outDir)))
+            for path in cityFigures[city])
+        rows.append(
+            '<tr><th>{0}</th><td>{1:.1f}%</td><td>{2:.1f}%</td>'
+            '<td>{3:.1f}%</td><td>{4:.3f}</td><td>{5:.3f}</td>{6}</tr>'.format(
+                escape(city), cdfs['threshold'] * 100,
+                cdfs['true_positive_rate'] * 100,
+                cdfs['false_positive_rate'] * 100,
+                np.nanmean(data['accuracy']),
+                np.nanmean(data['accuracy_by_rate']), cells))
+    html = (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+        '<title>Reporter quality report</title>'
+        '<style>table{border-collapse:collapse}'
+        'td,th{border:1px solid #ccc;padding:4px;text-align:center}</style>'
+        '</head><body><h1>Reporter quality report</h1><table>'
+        '<tr><th>city</th><th>speed error threshold</th>'
+        '<th>true positive rate</th><th>false positive rate</th>'
+        '<th>mean accuracy</th><th>mean accuracy (rate thresholds)</th>'
+        '<th colspan="99">figures</th></tr>\n' +
+        '\n'.join(rows) + '\n</table></body></html>\n')
+    path = os.path.join(outDir, 'index.html')
+    with open(path, 'w') as fp:
+        fp.write(html)
+    return path
+
+
+def build_report(cityResults, sampleRates, noiseLevels, outDir='report',
+                 processes=None):
+    # cityResults maps a city name to the (matchDf, speedDf) pair returned
+    # by get_route_metrics. Plot data is computed here; figures are drawn
+    # with the Agg backend in a process pool.
+    cityData = {}
+    cityFigures = {}
+    jobs = []
+    for city, (matchDf, speedDf) in cityResults.items():
+        cityDir = os.path.join(outDir, slugify(city))
+        if not os.path.isdir(cityDir):
+            os.makedirs(cityDir)
+        cityData[city] = get_city_report_data(
+            matchDf, speedDf, sampleRates, noiseLevels)
+        cityJobs = _city_jobs(cityDir, cityData[city], sampleRates,
+                              noiseLevels)
+        cityFigures[city] = [job[2] for job in cityJobs]
+        jobs.extend(cityJobs)
+
+    pool = Pool(processes=processes, initializer=_init_worker)
+    try:
+        pool.map(_render_figure, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return write_html_summary(outDir, cityData, cityFigures)
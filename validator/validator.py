@@ -1,7 +1,7 @@
 from __future__ import division
+import importlib
 import requests
 import time as t
-from shapely.geometry import LineString, MultiPoint, MultiLineString
 import numpy as np
 import json
 import pandas as pd
@@ -9,56 +9,169 @@ from random import shuffle
 from geojson import Feature, FeatureCollection
 import itertools
 from pyproj import Proj, transform
-from scipy.stats import norm
-from ipywidgets import Layout
-from ipyleaflet import (
-    Map,
-    TileLayer,
-    Circle,
-    GeoJSON
-)
-from matplotlib import pyplot as plt
 
+# Plotting (matplotlib) and map (ipywidgets/ipyleaflet) code lives in
+# validator.plotting and validator.maps and is only imported on first use,
+# so sweep workers and scripts that just synthesize and score stay light.
 
-def get_route_metrics(routeList, sampleRates, noiseLevels,
-                      turnPenaltyFactor=500,
-                      saveResults=True):
+Z_95 = 1.6448536269514722   # scipy.stats.norm.ppf(0.95)
 
-    distance_metrics = [
-        'segments', 'distance traveled', 'undermatches',
-        'undermatch distance', 'overmatches', 'overmatch distance']
+VALHALLA_URL = 'http://valhalla:8002'
+REPORTER_URL = 'http://reporter:8003'
+
+DISTANCE_METRICS = [
+    'segments', 'distance traveled', 'undermatches',
+    'undermatch distance', 'overmatches', 'overmatch distance']
+
+SPEED_METRICS = [
+    'edge_speed_error', 'pct_edges_too_fast', 'pct_edges_too_slow',
+    'segment_speed_error', 'pct_segments_too_fast',
+    'pct_segments_too_slow', 'segment_speed_error_matched',
+    'segment_speed_error_missed']
+
+SCORING_METRICS = DISTANCE_METRICS + SPEED_METRICS
+
+ROUTE_METRIC_COLUMNS = [
+    'route', 'noise', 'sample_rate', 'avg_density'] + SCORING_METRICS + [
+    'route_url', 'trace_attr_url', 'reporter_url']
+
+SPEED_COLUMNS = [
+    'route_name', 'segment_id', 'sample_rate', 'noise', 'pct_error',
+    'matched']
+
+
+def get_route_name(rteCoords):
+    # non-ascii characters are dropped; decode keeps str on python 3
+    stName = next(iter(rteCoords[0])).encode("ascii", "ignore").decode()
+    endName = next(iter(rteCoords[1])).encode("ascii", "ignore").decode()
+    return stName, endName
+
+
+def get_cell_scores(segments, dfEdges, gpsMatchEdges, sampleRate,
+                    times=None):
+    matchScores = get_match_scores(segments, dfEdges, gpsMatchEdges)
+    speedScores = get_speed_scores(
+        gpsMatchEdges, dfEdges, segments, sampleRate, times)
+    return list(matchScores) + list(speedScores[:-1]), speedScores[-1]
+
+
+def get_no_segment_scores():
+    # reporter matched nothing: distance metrics are flagged with -1
+    return [-1] * len(DISTANCE_METRICS) + [None] * len(SPEED_METRICS)
+
+
+def format_route_metrics(df):
+    for col in DISTANCE_METRICS + ['avg_density', 'noise', 'sample_rate']:
+        df[col] = df[col].astype(float)
+    df['score_density'] = df['segments'] * df['avg_density']
+    return df
+
+
+def concat_speed_dfs(speedDfs):
+    if not speedDfs:
+        return pd.DataFrame(columns=SPEED_COLUMNS)
+    return pd.concat(speedDfs, ignore_index=True)[SPEED_COLUMNS]
+
+
+def get_route_record(rteCoords, routeUrl, edges, shapeCoords, traceAttrUrl):
+    # what the sweeps keep of a route once it has been map_snapped: enough
+    # to run, cost and label its cells
+    stName, endName = get_route_name(rteCoords)
+    return {
+        'name': '{0}_to_{1}'.format(stName, endName),
+        'edges': edges, 'shape_coords': shapeCoords,
+        'avg_density': np.mean([edge['density'] for edge in edges]),
+        'multi_segment': format_edge_df(edges)['num_segments'].max() > 1,
+        'duration': sum(
+            edge['length'] * 3600.0 / max(edge['speed'], 1)
+            for edge in edges),
+        'num_shape_pts': len(shapeCoords),
+        'cols': {'route_url': routeUrl, 'trace_attr_url': traceAttrUrl}}
+
+
+def prepare_route(rteCoords, turnPenaltyFactor=500):
+    # route -> map_snap once; None if Valhalla has no usable route
+    shape, routeUrl = get_route_shape(rteCoords)
+    if shape is None:
+        print(routeUrl)
+        return None
+    edges, shapeCoords, traceAttrUrl = get_trace_attrs(
+        shape, shapeMatch="map_snap", turnPenaltyFactor=turnPenaltyFactor)
+    if edges is None:
+        print(traceAttrUrl)
+        return None
+    return get_route_record(
+        rteCoords, routeUrl, edges, shapeCoords, traceAttrUrl)
+
+
+def get_multi_segment_rows(route, sampleRates, noiseLevels):
+    # routes whose edges span several segments are not scored; like
+    # get_route_metrics, they get one unscored row per noise level
+    return [
+        dict(route['cols'], route=route['name'], noise=round(noise, 3),
+             sample_rate=sampleRates[0])
+        for noise in noiseLevels]
+
+
+def get_cell_metrics(routeName, edges, shapeCoords, noise, sampleRate,
+                     turnPenaltyFactor=500, localEpsg='2768', speedStore=None,
+                     **synthKwargs):
+    # one noise/sample rate cell of a route: the metrics row (without the
+    # route-level columns), the segment speed errors and the trace geojson
+    row = {'route': routeName, 'noise': noise, 'sample_rate': sampleRate}
+    dfEdges = format_edge_df(edges)
+    dfEdges, jsonDict, geojson, gpsMatchEdges = synthesize_gps(
+        dfEdges, shapeCoords, localEpsg, noise=noise, sampleRate=sampleRate,
+        turnPenaltyFactor=turnPenaltyFactor, **synthKwargs)
+    if gpsMatchEdges is None:
+        return row, None, geojson
+    segments, reportUrl = get_reporter_segments(jsonDict)
+    if segments is None:
+        return row, None, geojson
+    elif segments == 0:
+        row.update(zip(SCORING_METRICS, get_no_segment_scores()))
+        row['reporter_url'] = reportUrl
+        return row, None, geojson
+    scores, segSpeedDf = get_cell_scores(
+        segments, dfEdges, gpsMatchEdges, sampleRate,
+        jsonDict['trace']['time'])
+    if len(segSpeedDf) < 1:
+        return row, None, geojson
+    segSpeedDf.loc[:, 'route_name'] = routeName
+    segSpeedDf.loc[:, 'sample_rate'] = sampleRate
+    segSpeedDf.loc[:, 'noise'] = noise
+    if speedStore is not None:
+        speedStore.append(segSpeedDf)
+    row.update(zip(SCORING_METRICS, scores))
+    row['reporter_url'] = reportUrl
+    return row, segSpeedDf, geojson
 
-    speed_metrics = [
-        'edge_speed_error', 'pct_edges_too_fast', 'pct_edges_too_slow',
-        'segment_speed_error', 'pct_segments_too_fast',
-        'pct_segments_too_slow', 'segment_speed_error_matched',
-        'segment_speed_error_missed']
 
-    scoring_metrics = distance_metrics + speed_metrics
-
-    df = pd.DataFrame(columns=[
-        'route', 'noise', 'sample_rate', 'avg_density'] +
-        scoring_metrics + ['route_url', 'trace_attr_url', 'reporter_url'])
+def get_route_metrics(routeList, sampleRates, noiseLevels,
+                      turnPenaltyFactor=500,
+                      saveResults=True, speedStore=None, jitter=0,
+                      dropouts=None):
 
-    speedDf = pd.DataFrame(columns=[
-        'route_name', 'segment_id', 'sample_rate', 'noise', 'pct_error',
-        'matched'])
-    outDfRow = -1
+    rows = []
+    speedDfs = []
     tpf = turnPenaltyFactor
 
     for i, rteCoords in enumerate(routeList):
 
-        stName = rteCoords[0].keys()[0].encode("ascii", "ignore")
-        endName = rteCoords[1].keys()[0].encode("ascii", "ignore")
+        stName, endName = get_route_name(rteCoords)
         routeName = '{0}_to_{1}'.format(stName, endName)
         shape, routeUrl = get_route_shape(rteCoords)
         if shape is None:
-            print routeUrl
+            print(routeUrl)
             continue
         edges, shapeCoords, traceAttrUrl = get_trace_attrs(
             shape, shapeMatch="map_snap", turnPenaltyFactor=tpf)
-        edges = get_coords_per_second(shapeCoords, edges, '2768')
+        if edges is None:
+            print(traceAttrUrl)
+            continue
         avgDensity = np.mean([edge['density'] for edge in edges])
+        routeCols = {'route_url': routeUrl, 'trace_attr_url': traceAttrUrl}
+        multiSegmentEdges = format_edge_df(edges)['num_segments'].max() > 1
 
         for noise in noiseLevels:
             noise = round(noise, 3)
@@ -69,154 +182,55 @@ def get_route_metrics(routeList, sampleRates, noiseLevels,
                     "{1} // Sample Rate: {2}".format(
                         i, noise, sampleRate))
                 Hz = round(1 / sampleRate, 3)
-                outDfRow += 1
-                df.loc[
-                    outDfRow, [
-                        'route', 'noise', 'sample_rate',
-                        'route_url', 'trace_attr_url']] = [
-                            routeName, noise, sampleRate, routeUrl,
-                            traceAttrUrl]
-                dfEdges = format_edge_df(edges)
-                if dfEdges['num_segments'].max() > 1:
+                if multiSegmentEdges:
+                    rows.append(dict(
+                        routeCols, route=routeName, noise=noise,
+                        sample_rate=sampleRate))
                     break
-                dfEdges, jsonDict, geojson, gpsMatchEdges = synthesize_gps(
-                    dfEdges, shapeCoords, '2768', noise=noise,
-                    sampleRate=sampleRate, turnPenaltyFactor=tpf)
-
-                if jsonDict is None or geojson is None:
-                    msg = "Trace attributes tried to call more" + \
-                        " edges than are present in the route shape".format(
-                            routeName)
-                    df.loc[outDfRow, scoring_metrics + ['reporter_url']] = \
-                        [None] * 6 + [msg]
-                    continue
-                segments, reportUrl = get_reporter_segments(jsonDict)
-                if segments is None:
+                row, segSpeedDf, geojson = get_cell_metrics(
+                    routeName, edges, shapeCoords, noise, sampleRate,
+                    turnPenaltyFactor=tpf, speedStore=speedStore,
+                    jitter=jitter, dropouts=dropouts)
+                row.update(routeCols)
+                rows.append(row)
+                if segSpeedDf is None:
                     continue
-                elif segments == 0:
-                    msg = 'Reporter found 0 segments.'
-                    df.loc[outDfRow, scoring_metrics + ['reporter_url']] = \
-                        [-1] * 6 + [reportUrl]
-                    continue
-                segScore, distScore, undermatchScore, undermatchLenScore, \
-                    overmatchScore, overmatchLenScore = get_match_scores(
-                        segments, dfEdges, gpsMatchEdges)
-                edgeSpeedScore, pctTooFastEdges, pctTooSlowEdges, \
-                    segSpeedScore, pctTooFastSegs, pctTooSlowSegs, \
-                    segMatchSpeedScore, segMissSpeedScore, \
-                    segSpeedDf = get_speed_scores(
-                        gpsMatchEdges, dfEdges, segments, sampleRate)
-                if len(segSpeedDf) < 1:
-                    continue
-                segSpeedDf.loc[:, 'route_name'] = routeName
-                segSpeedDf.loc[:, 'sample_rate'] = sampleRate
-                segSpeedDf.loc[:, 'noise'] = noise
-                speedDf = pd.concat((speedDf, segSpeedDf), ignore_index=True)
-
-                df.loc[outDfRow, scoring_metrics + ['reporter_url']] = [
-                    segScore, distScore, undermatchScore, undermatchLenScore,
-                    overmatchScore, overmatchLenScore, edgeSpeedScore,
-                    pctTooFastEdges, pctTooSlowEdges, segSpeedScore,
-                    pctTooFastSegs, pctTooSlowSegs, segMatchSpeedScore,
-                    segMissSpeedScore, reportUrl]
-                df.loc[outDfRow, 'avg_density'] = avgDensity
-                df['segments'] = df['segments'].astype(float)
-                df['overmatches'] = df['overmatches'].astype(float)
-                df['undermatches'] = df['undermatches'].astype(float)
-                df['distance traveled'] = df['distance traveled'].astype(float)
-                df['overmatch distance'] = df[
-                    'overmatch distance'].astype(float)
-                df['undermatch distance'] = df[
-                    'undermatch distance'].astype(float)
-                df['avg_density'] = df['avg_density'].astype(float)
-                df['noise'] = df['noise'].astype(float)
-                df['sample_rate'] = df['sample_rate'].astype(float)
-                df['score_density'] = df['segments'] * df['avg_density']
+                row['avg_density'] = avgDensity
+                speedDfs.append(segSpeedDf)
 
                 if saveResults:
-                    with open(
-                        '../data/trace_{0}_to_{1}_w_{2}'
+                    save_trace_geojson(
+                        geojson, '../data/trace_{0}_to_{1}_w_{2}'
                         '_m_noise_at_{3}_Hz.geojson'.format(
-                            stName, endName, str(noise), str(Hz)), 'w+') as fp:
-                                json.dump(geojson, fp)
-
-    return df, speedDf
-
-
-def plot_segment_match_boxplots(df, sampleRates, saveFig=True):
-    for rate in sampleRates:
-        Hz = round(1 / rate, 3)
-        fig, ax = plt.subplots(figsize=(12, 8))
-        df[(df['sample_rate'] == rate) & (df['distance traveled'] >= 0)]. \
-            boxplot(column='distance traveled', by='noise', ax=ax, grid=True)
-        ax.set_ylim(0, 3)
-        ax.set_xlabel('Noise (m)', fontsize=15)
-        ax.set_ylabel('Match rate', fontsize=15)
-        ax.set_title('Sample Rate: {0} Hz'.format(Hz), fontsize=20)
-        fig.suptitle('')
-        if saveFig:
-            fig.savefig('./../data/score_vs_noise_{0}_Hz.png'.format(Hz))
-
-
-def plot_distance_metrics(df, sampleRates, saveFig=True):
-
-    norm = plt.Normalize()
-    cmap = plt.get_cmap('RdYlBu_r')
-    colors = cmap(norm(sampleRates))
-    distance_metrics = [
-        'segments', 'distance traveled', 'undermatches',
-        'undermatch distance', 'overmatches', 'overmatch distance']
-    metricArr = np.asarray(distance_metrics).reshape((3, 2))
-    fig, axarr = plt.subplots(3, 2, sharex=True, figsize=(16, 16))
-    for i, row in enumerate(axarr):
-        for j, col in enumerate(row):
-            metric = metricArr[i, j]
-            data = df[['noise', metric, 'sample_rate']].groupby(
-                ['sample_rate', 'noise']).agg('median').reset_index()
-            for k, rate in enumerate(sampleRates):
-                axarr[i, j].plot(
-                    data.loc[data['sample_rate'] == rate, 'noise'],
-                    data.loc[data['sample_rate'] == rate, metric],
-                    label=str(round(1 / rate, 3)) + ' Hz', alpha=0.7,
-                    color=colors[k])
-            axarr[i, j].legend(title='Sample Rate')
-            axarr[i, j].set_title(metric)
-
-    ax = fig.add_subplot(111, frameon=False)
-    plt.tick_params(
-        labelcolor='none', top='off', bottom='off', left='off', right='off')
-    ax.set_xlabel('Noise (m)', fontsize=15)
-    ax.set_ylabel('Match Error Rate', fontsize=15)
-    if saveFig:
-        fig.savefig('match_errors_by_sample_rate.png')
-
-
-def get_optimal_speed_error_threshold(speedDf, plot=True, saveFig=True):
-    fig, ax = plt.subplots(figsize=(12, 8))
-
-    # matched_n, bins, patches = ax.hist(
-    #     speedDf.loc[speedDf['matched'] == True, 'pct_error'], bins=100,
-    #     range=(-2, 11), label="matched segments", cumulative=True,
-    #     normed=True, histtype='step', linewidth=1.5, color='red')
-    # missed_n, bins, patches = ax.hist(
-    #     speedDf.loc[speedDf['matched'] == False, 'pct_error'], bins=100,
-    #     range=(-2, 11), label="unmatched segments", cumulative=True,
-    #     normed=True, histtype='step', linewidth=1.5, color='blue')
-
-    # bincenters = 0.5 * (bins[1:] + bins[:-1])
-    # freqDiff = matched_n - missed_n
-    # errorAtMaxDiff = bincenters[np.argmax(freqDiff)]
+                            stName, endName, str(noise), str(Hz)))
+
+    df = pd.DataFrame(rows, columns=ROUTE_METRIC_COLUMNS)
+    return format_route_metrics(df), concat_speed_dfs(speedDfs)
+
+
+def get_segment_match_data(df, sampleRate):
+    return df.loc[
+        (df['sample_rate'] == sampleRate) & (df['distance traveled'] >= 0),
+        ['noise', 'distance traveled']]
+
+
+def get_distance_metric_data(df):
+    return df[['noise', 'sample_rate'] + DISTANCE_METRICS].groupby(
+        ['sample_rate', 'noise']).agg('median').reset_index()
+
+
+def get_speed_error_cdfs(speedDf):
     matchedSorted = speedDf.loc[
         speedDf['matched'], 'pct_error'].sort_values()
     matchDensity, matchBinEdges = np.histogram(
-        matchedSorted, normed=True, bins=300, density=True)
+        matchedSorted, bins=300, density=True)
     matchUnityDensity = matchDensity / matchDensity.sum()
     matchCdf = np.cumsum(matchUnityDensity)
 
     missedSorted = speedDf.loc[
         speedDf['matched'] == False, 'pct_error'].sort_values()
     missDensity, missBinEdges = np.histogram(
-        missedSorted, normed=True, bins=300, density=True)
+        missedSorted, bins=300, density=True)
     missUnityDensity = missDensity / missDensity.sum()
     missCdf = np.cumsum(missUnityDensity)
     interpMissCdf = np.interp(
@@ -224,55 +238,18 @@ def get_optimal_speed_error_threshold(speedDf, plot=True, saveFig=True):
 
     alignedDiff = matchCdf - interpMissCdf
     maxDiffIdx = np.argmax(alignedDiff)
-    errorAtMaxDiff = matchBinEdges[:-1][maxDiffIdx]
-
-    truePositiveRate = matchCdf[maxDiffIdx]
-    truePostiveRateStr = np.round(truePositiveRate * 100, 1)
-    falsePositiveRate = interpMissCdf[maxDiffIdx]
-    falsePostiveRateStr = np.round(falsePositiveRate * 100, 1)
-    maxDiffPctStr = np.round((errorAtMaxDiff * 100), 1)
-
-    ax.plot(matchBinEdges[:-1], matchCdf, color='b', label='matched segments')
-    ax.plot(matchBinEdges[:-1], interpMissCdf, color='r',
-            label='unmatched segments')
-    ax.set_ylim(-0.01, 1.01)
-    ax.axvline(errorAtMaxDiff, linewidth=0.5, color='r')
-    ax.annotate(
-        'True Positive Rate: {0}%'.format(truePostiveRateStr),
-        xy=(errorAtMaxDiff, truePositiveRate), xytext=(0.6, 0.75),
-        textcoords='figure fraction', arrowprops=dict(
-            width=0.05, facecolor='black'))
-    ax.annotate(
-        'False Positive Rate: {0}%'.format(falsePostiveRateStr),
-        xy=(errorAtMaxDiff, falsePositiveRate), xytext=(0.6, 0.5),
-        textcoords='figure fraction', arrowprops=dict(
-            width=0.05, facecolor='black'))
-    ax.annotate(
-        'Optimal Error Threshold: {0}%'.format(maxDiffPctStr),
-        xy=(errorAtMaxDiff, 0.1), xytext=(0.6, 0.25),
-        textcoords='figure fraction', arrowprops=dict(
-            width=0.05, facecolor='black'))
-    ax2 = ax.twinx()
-    ax2.plot(matchBinEdges[:-1], alignedDiff, linewidth=1, color='k',
-             linestyle='--', label='Frequency Difference')
-    ax2.legend(loc='lower right')
-    ax2.set_ylabel('Difference in Cumulative Frequency', fontsize=15)
-    ax.legend(loc='upper right')
-    ax.set_xlim(-1, 10)
-    ax.set_xlabel("% Error: Segment Speed", fontsize=15)
-    ax.set_ylabel("Cumulative Frequency", fontsize=15)
-    if not plot:
-        plt.close()
-    else:
-        plt.show()
-    if saveFig:
-        fig.savefig('speed_error_cdfs.png')
 
-    return errorAtMaxDiff
+    return {
+        'bins': matchBinEdges[:-1],
+        'match_cdf': matchCdf,
+        'miss_cdf': interpMissCdf,
+        'diff': alignedDiff,
+        'threshold': matchBinEdges[:-1][maxDiffIdx],
+        'true_positive_rate': matchCdf[maxDiffIdx],
+        'false_positive_rate': interpMissCdf[maxDiffIdx]}
 
 
-def plot_accuracy_heatmap(speedDf, thresholds, sampleRates,
-                          noiseLevels, saveFig=True):
+def get_accuracy_matrix(speedDf, thresholds, sampleRates, noiseLevels):
     accMat = np.ones((len(sampleRates), len(noiseLevels)))
     for i, sampleRate in enumerate(sampleRates):
         if len(thresholds) == len(sampleRates):
@@ -283,6 +260,9 @@ def plot_accuracy_heatmap(speedDf, thresholds, sampleRates,
             df = speedDf.loc[
                 (speedDf['sample_rate'] == sampleRate) &
                 (speedDf['noise'] == noiseLevel)]
+            if len(df) == 0:
+                accMat[i, j] = np.nan
+                continue
 
             numTruePos = len(df.loc[
                 (speedDf['matched']) &
@@ -294,43 +274,9 @@ def plot_accuracy_heatmap(speedDf, thresholds, sampleRates,
 
             acc = (numTruePos + numTrueNeg) / len(df)
             accMat[i, j] = acc
-
-    fig, ax = plt.subplots(figsize=(12, 12))
-    im = ax.imshow(accMat, interpolation='none', extent=[
-        min(noiseLevels), max(noiseLevels), max(sampleRates),
-        min(sampleRates)])
-    plt.colorbar(im, fraction=0.02)
-    ax.set_xlabel("noise", fontsize=15)
-    ax.set_ylabel("sample rate", fontsize=15)
-    ax.set_yticks(
-        np.arange(min(sampleRates), max(sampleRates), len(sampleRates)))
-    ax.set_yticklabels([''] + map(str, (map(int, sampleRates))))
-    ax.set_title("Accuracy at Optimal Error Threshold", fontsize=15)
-    plt.show()
-    if saveFig:
-        fig.savefig('map_matching_acc_at_threshold.png')
     return accMat
 
 
-def plot_change_in_acc(oneSizeFitsAllAcc, rateSpecificAcc, sampleRates,
-                       noiseLevels):
-    fig, ax = plt.subplots(figsize=(12, 12))
-    ax.set_xlabel("noise", fontsize=15)
-    ax.set_ylabel("sample rate", fontsize=15)
-    ax.set_yticks(
-        np.arange(min(sampleRates), max(sampleRates), len(sampleRates)))
-    ax.set_yticklabels([''] + map(str, (map(int, sampleRates))))
-    accDiff = rateSpecificAcc - oneSizeFitsAllAcc
-    limit = np.max(np.abs(accDiff))
-    im = ax.imshow(
-        accDiff, cmap='RdYlGn', vmin=-limit, vmax=limit,
-        extent=[min(noiseLevels), max(noiseLevels),
-                max(sampleRates), min(sampleRates)])
-    ax.set_title(
-        "Change in Accuracy Using Rate-Specific Thresholds", fontsize=15)
-    plt.colorbar(im, fraction=0.02)
-
-
 def convert_coords_to_meters(coords, localEpsg, inputOrder='lonlat'):
     if inputOrder == 'latlon':
         indices = [1, 0]
@@ -361,6 +307,51 @@ def convert_coords_to_lat_lon(coords, localEpsg, inputOrder='xy'):
     return projCoords
 
 
+TRACE_DTYPE = np.dtype([('lat', 'f8'), ('lon', 'f8'), ('time', 'f8')])
+
+
+def encode_polyline(lon, lat, precision=1e6):
+    # vectorised inverse of decode
+    ints = np.round(np.column_stack((lat, lon)) * precision).astype(np.int64)
+    deltas = np.diff(np.vstack(([[0, 0]], ints)), axis=0).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    shifts = np.arange(0, 35, 5)
+    chunks = (zigzag[:, None] >> shifts) & 0x1f
+    numChunks = 1 + np.sum((zigzag[:, None] >> shifts[1:]) > 0, axis=1)
+    col = np.arange(len(shifts))
+    valid = col[None, :] < numChunks[:, None]
+    more = col[None, :] < (numChunks - 1)[:, None]
+    chars = (chunks | (more * 0x20)) + 63
+    return chars[valid].astype(np.uint8).tobytes().decode('ascii')
+
+
+def dumps_trace(trace, withTime=True):
+    # JSON for a TRACE_DTYPE array in a single string-format call
+    if len(trace) == 0:
+        return '[]'
+    if withTime:
+        times = trace['time']
+        timeFmt = '%d' if np.all(times == np.round(times)) else '%.3f'
+        fmt = '{"lat":%.6f,"lon":%.6f,"time":' + timeFmt + '}'
+        values = np.column_stack((trace['lat'], trace['lon'], times))
+    else:
+        fmt = '{"lat":%.6f,"lon":%.6f}'
+        values = np.column_stack((trace['lat'], trace['lon']))
+    return '[' + ','.join([fmt] * len(trace)) % tuple(
+        values.ravel().tolist()) + ']'
+
+
+def dumps_report_payload(gpsTrace):
+    trace = gpsTrace.get('trace')
+    if not isinstance(trace, np.ndarray):
+        return json.dumps(gpsTrace, separators=(',', ':'))
+    rest = json.dumps(
+        {k: v for k, v in gpsTrace.items() if k != 'trace'},
+        separators=(',', ':'))
+    return '{"trace":' + dumps_trace(trace) + (
+        ',' + rest[1:] if len(rest) > 2 else '}')
+
+
 def decode(encoded):
     inv = 1.0 / 1e6
     decoded = []
@@ -385,6 +376,7 @@ def decode(encoded):
 
 
 def get_coords_per_second(shapeCoords, edges, localEpsg):
+    from shapely.geometry import LineString
     mProj = Proj(init='epsg:{0}'.format(localEpsg))
     llProj = Proj(init='epsg:4326')
     coords = shapeCoords
@@ -416,12 +408,100 @@ def get_coords_per_second(shapeCoords, edges, localEpsg):
     return edges
 
 
-def synthesize_gps(dfEdges, shapeCoords, localEpsg, distribution="normal",
-                   noise=0, sampleRate=1, uuid="999999", shapeMatch="map_snap",
-                   mode="auto", turnPenaltyFactor=0, breakageDist=2000, beta=3,
-                   sigmaZ=4.07, searchRadius=50):
+def get_route_timeline(shapeCoords, edges, localEpsg):
+    # Piecewise-linear (time -> projected position) along the route, with
+    # each edge traversed at its own speed. Positions at any timestamp come
+    # from interpolating between shape vertices, so nothing is materialised
+    # per second.
+    mProj = Proj(init='epsg:{0}'.format(localEpsg))
+    llProj = Proj(init='epsg:4326')
+    coords = np.asarray(shapeCoords, dtype=float)
+    x, y = transform(llProj, mProj, coords[:, 0], coords[:, 1])
+    xy = np.column_stack((x, y))
+    vertexTimes = []
+    vertexXy = []
+    edgeEndTimes = []
+    elapsed = 0.0
+    for edge in edges:
+        beginShapeIndex = edge['begin_shape_index']
+        endShapeIndex = edge['end_shape_index']
+        if (beginShapeIndex >= len(coords) - 1) | \
+           (endShapeIndex >= len(coords)):
+            edgeEndTimes.append(elapsed)
+            continue
+        edgeXy = xy[beginShapeIndex:endShapeIndex + 1]
+        cumDist = np.concatenate(([0], np.cumsum(
+            np.hypot(*np.diff(edgeXy, axis=0).T))))
+        if cumDist[-1] > 0:
+            fraction = cumDist / cumDist[-1]
+        else:
+            fraction = np.linspace(0, 1, len(edgeXy))
+        duration = edge['length'] * 3600.0 / max(edge['speed'], 1)
+        first = 1 if vertexTimes else 0
+        vertexTimes.append(elapsed + duration * fraction[first:])
+        vertexXy.append(edgeXy[first:])
+        elapsed += duration
+        edgeEndTimes.append(elapsed)
+    vertexXy = np.concatenate(vertexXy)
+    return {
+        'time': np.concatenate(vertexTimes),
+        'x': vertexXy[:, 0],
+        'y': vertexXy[:, 1],
+        'edge_end_time': np.asarray(edgeEndTimes),
+        'duration': elapsed}
+
+
+def get_sample_times(duration, sampleRate=1, jitter=0, dropouts=None,
+                     seed=None):
+    # seconds since route start at which the device reports a fix: a fixed
+    # interval, optionally jittered (std dev in seconds), minus any
+    # (start, stop) dropout windows such as tunnels. The route end is
+    # always reported unless it falls in a dropout.
+    if jitter > 0:
+        rng = np.random.RandomState(seed)
+        numSamples = int(np.ceil(duration / sampleRate)) + 1
+        intervals = np.clip(
+            rng.normal(sampleRate, jitter, size=int(numSamples * 1.5) + 10),
+            0.1 * sampleRate, None)
+        times = np.concatenate(([0], np.cumsum(intervals)))
+        times = times[times < duration]
+    else:
+        times = np.arange(0, duration, sampleRate, dtype=float)
+    times = np.append(times, duration)
+    for start, stop in (dropouts or []):
+        times = times[(times < start) | (times > stop)]
+    return times
+
 
-    accuracy = round(min(100, norm.ppf(0.95, loc=0, scale=max(1, noise))), 2)
+def resample_route(timeline, times):
+    x = np.interp(times, timeline['time'], timeline['x'])
+    y = np.interp(times, timeline['time'], timeline['y'])
+    edgeIdx = np.searchsorted(timeline['edge_end_time'], times, side='left')
+    edgeIdx = np.clip(edgeIdx, 0, len(timeline['edge_end_time']) - 1)
+    return x, y, edgeIdx
+
+
+def get_gps_noise(numSamples, noise, sampleRate):
+    # Every fix after the first is displaced into the same quadrant as the
+    # first, smoothed by a rolling mean over the last few draws so that
+    # consecutive fixes drift together like a real receiver.
+    noiseLookback = int(np.ceil(30 / (sampleRate + 2)))
+    adjs = np.abs(np.random.normal(scale=noise, size=(numSamples, 2)))
+    quad = np.sign(np.random.normal(scale=noise, size=2))
+    adjs *= quad
+    cumAdjs = np.vstack((np.zeros((1, 2)), np.cumsum(adjs, axis=0)))
+    idx = np.arange(1, numSamples + 1)
+    lookbackStart = np.maximum(idx - noiseLookback, 0)
+    return (cumAdjs[idx] - cumAdjs[lookbackStart]) / \
+        (idx - lookbackStart)[:, None]
+
+
+def synthesize_trace(dfEdges, shapeCoords, localEpsg, noise=0, sampleRate=1,
+                     uuid="999999", shapeMatch="map_snap", mode="auto",
+                     turnPenaltyFactor=0, breakageDist=2000, beta=3,
+                     sigmaZ=4.07, searchRadius=50, jitter=0, dropouts=None):
+
+    accuracy = round(min(100, Z_95 * max(1, noise)), 2)
     mProj = Proj(init='epsg:{0}'.format(localEpsg))
     llProj = Proj(init='epsg:4326')
     jsonDict = {
@@ -434,124 +514,167 @@ def synthesize_gps(dfEdges, shapeCoords, localEpsg, distribution="normal",
             "sigma_z": sigmaZ,
             "search_radius": searchRadius,
             "gps_accuracy": accuracy}}
-    trueRouteCoords = []
-    resampledCoords = []
-    gpsRouteCoords = []
-    displacementLines = []
-    lonAdjs = []
-    latAdjs = []
-    noiseLookback = int(np.ceil(30 / (sampleRate + 2)))
     sttm = int(t.time()) - 86400   # yesterday
-    seconds = 0
-    shapeIndexCounter = 0
-    for i, edge in dfEdges.iterrows():
-        if i == 0:
-            trueCoords = shapeCoords[edge['begin_shape_index']]
-            trueRouteCoords.append(trueCoords)
-        trueCoords = shapeCoords[edge['end_shape_index']]
-        trueRouteCoords.append(trueCoords)
-        edgeShapeIndices = []
-        for j, coordPair in enumerate(edge['oneSecCoords']):
-            if (not seconds % sampleRate) | (
-                (i + 1 == len(dfEdges)) &
-                (j + 1 == len(edge['oneSecCoords']))
-            ):
-                lon, lat = coordPair
-                resampledCoords.append([lon, lat])
-                if noise > 0:
-                    projLon, projLat = transform(llProj, mProj, lon, lat)
-                    while True:
-                        lonAdj = np.random.normal(scale=noise)
-                        latAdj = np.random.normal(scale=noise)
-                        if shapeIndexCounter == 0:
-                            noiseQuad = [np.sign(lonAdj), np.sign(latAdj)]
-                            break
-                        elif [np.sign(lonAdj), np.sign(latAdj)] == noiseQuad:
-                            break
-                    lonAdjs.append(lonAdj)
-                    latAdjs.append(latAdj)
-                    newProjLon = projLon + np.mean(lonAdjs[-noiseLookback:])
-                    newProjLat = projLat + np.mean(latAdjs[-noiseLookback:])
-                    projLon, projLat = newProjLon, newProjLat
-                    lon, lat = transform(mProj, llProj, projLon, projLat)
-                time = sttm + seconds
-                lat = round(lat, 6)
-                lon = round(lon, 6)
-                jsonDict["trace"].append({
-                    "lat": lat, "lon": lon, "time": time})
-                gpsRouteCoords.append([lon, lat])
-                displacementLines.append([coordPair, [lon, lat]])
-                edgeShapeIndices.append(shapeIndexCounter)
-                shapeIndexCounter += 1
-            seconds += 1
-        if len(edgeShapeIndices) > 0:
-            dfEdges.loc[
-                i, 'begin_resampled_shape_index'] = min(edgeShapeIndices)
-            dfEdges.loc[
-                i, 'end_resampled_shape_index'] = max(edgeShapeIndices)
-
-    gpsShape = [{"lat": d["lat"], "lon": d["lon"]} for d in jsonDict['trace']]
-    gpsMatchEdges, gpsMatchCoords, _ = get_trace_attrs(
-        gpsShape, encoded=False, gpsAccuracy=accuracy, mode=mode,
-        turnPenaltyFactor=turnPenaltyFactor, breakageDist=breakageDist,
-        beta=beta, sigmaZ=sigmaZ, searchRadius=searchRadius)
 
-    geojson = FeatureCollection([
-        Feature(geometry=LineString(
-            trueRouteCoords), properties={"style": {
+    edges = dfEdges.to_dict('records')
+    trueRouteCoords = [shapeCoords[edges[0]['begin_shape_index']]] + [
+        shapeCoords[edge['end_shape_index']] for edge in edges]
+
+    timeline = get_route_timeline(shapeCoords, edges, localEpsg)
+    sampleTimes = get_sample_times(
+        timeline['duration'], sampleRate, jitter, dropouts)
+    x, y, edgeIdx = resample_route(timeline, sampleTimes)
+    trueLon, trueLat = transform(mProj, llProj, x, y)
+    if noise > 0:
+        adjs = get_gps_noise(len(sampleTimes), noise, sampleRate)
+        lon, lat = transform(mProj, llProj, x + adjs[:, 0], y + adjs[:, 1])
+    else:
+        lon, lat = trueLon, trueLat
+    lon = np.round(lon, 6)
+    lat = np.round(lat, 6)
+
+    trace = np.empty(len(sampleTimes), dtype=TRACE_DTYPE)
+    trace['lat'] = lat
+    trace['lon'] = lon
+    trace['time'] = np.round(sttm + sampleTimes, 3)
+    jsonDict["trace"] = trace
+    resampledCoords = np.column_stack((trueLon, trueLat)).tolist()
+    gpsRouteCoords = np.column_stack((lon, lat)).tolist()
+    displacementLines = [
+        [true, gps] for true, gps in zip(resampledCoords, gpsRouteCoords)]
+
+    edgeNums, firstIdx = np.unique(edgeIdx, return_index=True)
+    lastIdx = len(edgeIdx) - 1 - np.unique(
+        edgeIdx[::-1], return_index=True)[1]
+    for edgeNum, begin, end in zip(edgeNums, firstIdx, lastIdx):
+        label = dfEdges.index[edgeNum]
+        dfEdges.loc[label, 'begin_resampled_shape_index'] = begin
+        dfEdges.loc[label, 'end_resampled_shape_index'] = end
+
+    traceCoords = {
+        'true_route_coords': trueRouteCoords,
+        'resampled_coords': resampledCoords,
+        'gps_coords': gpsRouteCoords,
+        'displacement_lines': displacementLines}
+    return dfEdges, jsonDict, traceCoords
+
+
+def get_gps_match_kwargs(jsonDict):
+    opts = jsonDict['match_options']
+    return {
+        'gpsAccuracy': opts['gps_accuracy'], 'mode': opts['mode'],
+        'turnPenaltyFactor': opts['turn_penalty_factor'],
+        'breakageDist': opts['breakage_distance'], 'beta': opts['beta'],
+        'sigmaZ': opts['sigma_z'], 'searchRadius': opts['search_radius']}
+
+
+def get_trace_geojson(traceCoords, gpsMatchCoords):
+    trueRouteCoords = traceCoords['true_route_coords']
+    resampledCoords = traceCoords['resampled_coords']
+    gpsRouteCoords = traceCoords['gps_coords']
+    displacementLines = traceCoords['displacement_lines']
+    return FeatureCollection([
+        Feature(geometry={
+            "type": "LineString",
+            "coordinates": trueRouteCoords}, properties={"style": {
                 "color": "#ff0000",
                 "weight": "3px"},
                 "name": "true_route_coords"}),
-        Feature(geometry=MultiPoint(
-            resampledCoords), properties={"style": {
+        Feature(geometry={
+            "type": "MultiPoint",
+            "coordinates": resampledCoords}, properties={"style": {
                 "color": "#ff0000",
                 "weight": "3px"},
                 "name": "resampled_coords"}),
-        Feature(geometry=MultiPoint(
-            gpsRouteCoords), properties={"style": {
+        Feature(geometry={
+            "type": "MultiPoint",
+            "coordinates": gpsRouteCoords}, properties={"style": {
                 "color": "#0000ff",
                 "weight": "3px"},
                 "name": "gps_coords"}),
-        Feature(geometry=MultiLineString(
-            displacementLines), properties={"style": {
+        Feature(geometry={
+            "type": "MultiLineString",
+            "coordinates": displacementLines}, properties={"style": {
                 "color": "#000000",
                 "weight": "1px",
                 "name": "displacement_lines"}}),
-        Feature(geometry=LineString(
-            gpsMatchCoords), properties={"style": {
+        Feature(geometry={
+            "type": "LineString",
+            "coordinates": gpsMatchCoords}, properties={"style": {
                 "fillcolor": "#0000ff",
                 "weight": "3px",
                 "name": "matched_gps_route"}})])
 
-    return dfEdges, jsonDict, geojson, gpsMatchEdges
 
+def synthesize_gps(dfEdges, shapeCoords, localEpsg, distribution="normal",
+                   noise=0, sampleRate=1, uuid="999999", shapeMatch="map_snap",
+                   mode="auto", turnPenaltyFactor=0, breakageDist=2000, beta=3,
+                   sigmaZ=4.07, searchRadius=50, jitter=0, dropouts=None):
+
+    dfEdges, jsonDict, traceCoords = synthesize_trace(
+        dfEdges, shapeCoords, localEpsg, noise=noise, sampleRate=sampleRate,
+        uuid=uuid, shapeMatch=shapeMatch, mode=mode,
+        turnPenaltyFactor=turnPenaltyFactor, breakageDist=breakageDist,
+        beta=beta, sigmaZ=sigmaZ, searchRadius=searchRadius, jitter=jitter,
+        dropouts=dropouts)
+    gpsMatchEdges, gpsMatchCoords, _ = get_trace_attrs(
+        jsonDict['trace'], **get_gps_match_kwargs(jsonDict))
+    geojson = get_trace_geojson(traceCoords, gpsMatchCoords or [])
+
+    return dfEdges, jsonDict, geojson, gpsMatchEdges
 
-def get_route_shape(routeCoords):
 
-    stLat = routeCoords[0].values()[0]["lat"]
-    stLon = routeCoords[0].values()[0]["lon"]
-    endLat = routeCoords[1].values()[0]["lat"]
-    endLon = routeCoords[1].values()[0]["lon"]
+def get_route_params(routeCoords):
+    start = next(iter(routeCoords[0].values()))
+    end = next(iter(routeCoords[1].values()))
+    stLat, stLon = start["lat"], start["lon"]
+    endLat, endLon = end["lat"], end["lon"]
     jsonDict = {"locations": [{
         "lat": stLat, "lon": stLon, "type": "break"},
         {
         "lat": endLat, "lon": endLon, "type": "break"}],
         "costing": "auto",
         "id": "my_work_route"}
-    payload = {"json": json.dumps(jsonDict, separators=(',', ':'))}
-    baseUrl = 'http://valhalla:8002/route'
-    route = requests.get(baseUrl, params=payload)
-    shape = route.json()['trip']['legs'][0]['shape']
+    return {"json": json.dumps(jsonDict, separators=(',', ':'))}
+
 
+def parse_route_shape(route):
     if route.status_code == 200:
-        return shape, route.url
+        return route.json()['trip']['legs'][0]['shape'], route.url
     else:
         return None, 'No shape returned.'
 
 
-def get_trace_attrs(shape, encoded=True, shapeMatch='map_snap',
-                    gpsAccuracy=5, mode="auto", turnPenaltyFactor=0,
-                    breakageDist=2000, beta=3, sigmaZ=4.07, searchRadius=50):
+def get_route_shape(routeCoords):
+
+    payload = get_route_params(routeCoords)
+    baseUrl = VALHALLA_URL + '/route'
+    route = requests.get(baseUrl, params=payload)
+    return parse_route_shape(route)
+
+
+def parse_route_length(route):
+    if route.status_code == 200:
+        return route.json()['trip']['summary']['length']
+    else:
+        return None
+
+
+def get_route_length(routeCoords):
+
+    payload = get_route_params(routeCoords)
+    baseUrl = VALHALLA_URL + '/route'
+    route = requests.get(baseUrl, params=payload)
+    return parse_route_length(route)
+
+
+def get_trace_attrs_params(shape, encoded=True, shapeMatch='map_snap',
+                           gpsAccuracy=5, mode="auto", turnPenaltyFactor=0,
+                           breakageDist=2000, beta=3, sigmaZ=4.07,
+                           searchRadius=50):
+    if isinstance(shape, np.ndarray):
+        shape = encode_polyline(shape['lon'], shape['lat'])
+        encoded = True
     if encoded:
         shapeParam = 'encoded_polyline'
     else:
@@ -570,20 +693,40 @@ def get_trace_attrs(shape, encoded=True, shapeMatch='map_snap',
             "search_radius": searchRadius
         }
     }
-    payload = {"json": json.dumps(jsonDict, separators=(',', ':'))}
-    baseUrl = 'http://valhalla:8002/trace_attributes?'
-    matched = requests.get(baseUrl, params=payload)
-    edges = matched.json()['edges']
-    matchedPts = decode(matched.json()['shape'])
+    return {"json": json.dumps(jsonDict, separators=(',', ':'))}
+
+
+def parse_trace_attrs(matched):
+    # trace_attributes answers 4xx when it cannot match a (noisy) trace
+    if matched.status_code != 200:
+        return None, None, matched.reason
+    body = matched.json()
+    edges = body['edges']
+    matchedPts = decode(body['shape'])
     return edges, matchedPts, matched.url
 
 
+def get_trace_attrs(shape, encoded=True, shapeMatch='map_snap',
+                    gpsAccuracy=5, mode="auto", turnPenaltyFactor=0,
+                    breakageDist=2000, beta=3, sigmaZ=4.07, searchRadius=50):
+    payload = get_trace_attrs_params(
+        shape, encoded=encoded, shapeMatch=shapeMatch,
+        gpsAccuracy=gpsAccuracy, mode=mode,
+        turnPenaltyFactor=turnPenaltyFactor, breakageDist=breakageDist,
+        beta=beta, sigmaZ=sigmaZ, searchRadius=searchRadius)
+    baseUrl = VALHALLA_URL + '/trace_attributes?'
+    matched = requests.get(baseUrl, params=payload)
+    return parse_trace_attrs(matched)
+
+
 def format_edge_df(edges):
 
     dfEdges = pd.DataFrame(edges)
-    dfEdges = dfEdges[[
+    # oneSecCoords is only present if get_coords_per_second was called
+    dfEdges = dfEdges[[col for col in [
         'id', 'begin_shape_index', 'end_shape_index', 'length',
-        'speed', 'density', 'traffic_segments', 'oneSecCoords']]
+        'speed', 'density', 'traffic_segments', 'oneSecCoords']
+        if col in dfEdges.columns]]
     dfEdges['segment_id'] = dfEdges['traffic_segments'].apply(
         lambda x: str(x[0]['segment_id']) if type(x) is list else None)
     dfEdges['num_segments'] = dfEdges['traffic_segments'].apply(
@@ -602,12 +745,7 @@ def format_edge_df(edges):
     return dfEdges
 
 
-def get_reporter_segments(gpsTrace):
-
-    baseUrl = 'http://reporter:8003/report'
-    payload = {"json": json.dumps(gpsTrace, separators=(',', ':'))}
-    report = requests.get(baseUrl, params=payload)
-    # report = requests.post(baseUrl, json=gpsTrace)
+def parse_reporter_segments(report):
     if report.status_code == 200:
         segments = report.json()['segment_matcher']['segments']
     else:
@@ -618,6 +756,15 @@ def get_reporter_segments(gpsTrace):
         return 0, report.url
 
 
+def get_reporter_segments(gpsTrace):
+
+    baseUrl = REPORTER_URL + '/report'
+    payload = {"json": dumps_report_payload(gpsTrace)}
+    report = requests.get(baseUrl, params=payload)
+    # report = requests.post(baseUrl, json=gpsTrace)
+    return parse_reporter_segments(report)
+
+
 def get_match_scores(segments, dfEdges, gpsMatchEdges):
 
     segDf = pd.DataFrame(segments, columns=[
@@ -649,15 +796,28 @@ def get_match_scores(segments, dfEdges, gpsMatchEdges):
         overmatchScore, overmatchLenScore
 
 
-def get_speed_scores(gpsMatchEdges, dfEdges, segments, sampleRate):
-
+def get_speed_scores(gpsMatchEdges, dfEdges, segments, sampleRate,
+                     times=None):
+    # times are the trace timestamps; with jitter, dropouts or real traces
+    # the fixes are not sampleRate apart, so edge durations come from them.
+    # Shape indices refer to the matched shape, which can have more points
+    # than the trace, so edges indexed past the last fix fall back to
+    # sampleRate.
     gpsEdgeSpeeds = pd.DataFrame([(
         edge['id'], edge['begin_shape_index'], edge['end_shape_index'],
         edge['length'])for edge in gpsMatchEdges],
         columns=['id', 'begin_shape_index', 'end_shape_index', 'length'])
-    gpsEdgeSpeeds['speed'] = gpsEdgeSpeeds['length'] / (
-        (gpsEdgeSpeeds['end_shape_index'] -
-            gpsEdgeSpeeds['begin_shape_index']) * (sampleRate / 3600))
+    begin = gpsEdgeSpeeds['begin_shape_index'].values.astype(int)
+    end = gpsEdgeSpeeds['end_shape_index'].values.astype(int)
+    hours = (end - begin) * (sampleRate / 3600)
+    if times is not None:
+        times = np.asarray(times, dtype=float)
+        timed = (begin >= 0) & (end < len(times))
+        hours = np.where(timed, (
+            times[np.where(timed, end, 0)] -
+            times[np.where(timed, begin, 0)]) / 3600, hours)
+    gpsEdgeSpeeds['speed'] = gpsEdgeSpeeds['length'] / \
+        np.where(hours > 0, hours, np.nan)
     gpsEdgeSpeeds = gpsEdgeSpeeds[['id', 'length', 'speed']]
     gpsEdgeSpeeds['matched'] = gpsEdgeSpeeds['id'].isin(
         dfEdges['id'])
@@ -752,22 +912,9 @@ def get_POI_routes_by_length(locString, minRouteLength, maxRouteLength,
         routeList = list(itertools.combinations(POIs, 2))
         shuffle(routeList)
         for route in routeList:
-            stLat = route[0].values()[0]["lat"]
-            stLon = route[0].values()[0]["lon"]
-            endLat = route[1].values()[0]["lat"]
-            endLon = route[1].values()[0]["lon"]
-            jsonDict = {"locations": [{
-                "lat": stLat, "lon": stLon, "type": "break"},
-                {
-                "lat": endLat, "lon": endLon, "type": "break"}],
-                "costing": "auto",
-                "id": "my_work_route"}
-            payload = {"json": json.dumps(jsonDict, separators=(',', ':'))}
-            baseUrlValhalla = 'http://valhalla:8002/route'
-            routeCheck = requests.get(baseUrlValhalla, params=payload)
-            if routeCheck.status_code != 200:
+            length = get_route_length(route)
+            if length is None:
                 continue
-            length = routeCheck.json()['trip']['summary']['length']
             if minRouteLength < length < maxRouteLength:
                 goodRoutes.append(route)
         try:
@@ -805,7 +952,8 @@ def get_routes_by_length(cityStr, minRouteLength, maxRouteLength,
     venueListIter = 0
     sttm = t.time()
 
-    while (len(goodRoutes) < numResults) & (t.time() - sttm < 300):
+    while (len(goodRoutes) < numResults) & (t.time() - sttm < 300) & \
+            (venueListIter < len(venueListBreakPoints)):
         venueChunkIdx = venueListBreakPoints[venueListIter]
         POIs = []
         baseUrlVenues = 'https://whosonfirst-api.mapzen.com?' + \
@@ -820,20 +968,9 @@ def get_routes_by_length(cityStr, minRouteLength, maxRouteLength,
                 "lon": info['geom:longitude']}})
         routeList = list(itertools.combinations(POIs, 2))
         for route in routeList:
-            stLat = route[0].values()[0]["lat"]
-            stLon = route[0].values()[0]["lon"]
-            endLat = route[1].values()[0]["lat"]
-            endLon = route[1].values()[0]["lon"]
-            jsonDict = {"locations": [{
-                "lat": stLat, "lon": stLon, "type": "break"},
-                {
-                "lat": endLat, "lon": endLon, "type": "break"}],
-                "costing": "auto",
-                "id": "my_work_route"}
-            payload = {"json": json.dumps(jsonDict, separators=(',', ':'))}
-            baseUrlValhalla = 'http://valhalla:8002/route'
-            routeCheck = requests.get(baseUrlValhalla, params=payload)
-            length = routeCheck.json()['trip']['summary']['length']
+            length = get_route_length(route)
+            if length is None:
+                continue
             if minRouteLength < length < maxRouteLength:
                 goodRoutes.append(route)
         venueListIter += 1
@@ -843,35 +980,37 @@ def get_routes_by_length(cityStr, minRouteLength, maxRouteLength,
     return goodRoutes
 
 
-def generate_route_map(pathToGeojson, zoomLevel=11):
+TRACE_FEATURES = [
+    'true_route_coords', 'resampled_coords', 'gps_coords',
+    'displacement_lines', 'matched_gps_route']
+TRACE_HEADER = '{"type": "FeatureCollection", "features": ['
+
+
+def save_trace_geojson(geojson, path):
+    # one feature per line so readers can parse only the ones they need
+    with open(path, 'w+') as fp:
+        fp.write(TRACE_HEADER + '\n')
+        fp.write(',\n'.join(
+            json.dumps(feature) for feature in geojson['features']))
+        fp.write('\n]}\n')
+
 
+def load_trace_features(pathToGeojson, features=None):
+    names = TRACE_FEATURES if features is None else features
+    wanted = set(TRACE_FEATURES.index(name) for name in names)
+    loaded = {}
     with open(pathToGeojson, "r") as f:
-        data = json.load(f)
-    ctrLon, ctrLat = np.mean(
-        np.array(data['features'][0]['geometry']['coordinates']), axis=0)
-    url = "http://stamen-tiles-{s}.a.ssl.fastly.net/toner-lite/{z}/{x}/{y}.png"
-    provider = TileLayer(url=url, opacity=1)
-    center = [ctrLat, ctrLon]
-    m = Map(default_tiles=provider, center=center, zoom=zoomLevel)
-    m.layout = Layout(width='100%', height='800px')
-    trueRouteCoords, resampledCoords, gpsRouteCoords, \
-        displacementLines, gpsMatchCoords = data['features']
-    g = GeoJSON(data=FeatureCollection(
-        [trueRouteCoords, gpsMatchCoords]))
-    m.add_layer(g)
-    for coords in resampledCoords['geometry']['coordinates']:
-        cm = Circle(
-            location=coords[::-1], radius=10, weight=1, color='#ff0000',
-            opacity=1.0, fill_opacity=0.4, fill_color='#ff0000')
-        m.add_layer(cm)
-    for coords in gpsRouteCoords['geometry']['coordinates']:
-        cm = Circle(
-            location=coords[::-1], radius=10, weight=1, color='#0000ff',
-            opacity=1.0, fill_opacity=0.4, fill_color='#0000ff')
-        m.add_layer(cm)
-    g = GeoJSON(data=displacementLines)
-    m.add_layer(g)
-    return m
+        if f.readline().strip() != TRACE_HEADER:
+            f.seek(0)
+            allFeatures = json.load(f)['features']
+            return {TRACE_FEATURES[i]: allFeatures[i] for i in wanted}
+        for i, line in enumerate(f):
+            if i in wanted:
+                loaded[TRACE_FEATURES[i]] = json.loads(
+                    line.rstrip().rstrip(','))
+                if len(loaded) == len(wanted):
+                    break
+    return loaded
 
 
 def getLineFromPoints(point1, point2):
@@ -892,6 +1031,7 @@ def getPerpLineThruEndpt(slope, endpoint):
 
 
 def getBoundaryLineCoords(slope, intercept, midpoint, noise, localEpsg='2768'):
+    from shapely.geometry import LineString
 
     midx, midy = midpoint
     tmpLeftX = midx - (noise * 2)
@@ -928,3 +1068,24 @@ def checkForBackTrack(lastSegCoords, newPoint, noise):
         return True, bl
     else:
         return False, bl
+
+
+def _lazy(module, name):
+    def wrapper(*args, **kwargs):
+        return getattr(importlib.import_module(module), name)(*args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in [
+        'render_segment_match_boxplot', 'plot_segment_match_boxplots',
+        'render_distance_metrics', 'plot_distance_metrics',
+        'render_speed_error_cdfs', 'get_optimal_speed_error_threshold',
+        'render_accuracy_heatmap', 'plot_accuracy_heatmap',
+        'plot_change_in_acc']:
+    globals()[_name] = _lazy('validator.plotting', _name)
+
+for _name in [
+        'simplify_indices', 'get_meters_per_pixel', 'get_point_circles',
+        'get_simplified_trace_features', 'generate_route_map']:
+    globals()[_name] = _lazy('validator.maps', _name)